@@ -0,0 +1,105 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Compares the per-call cost of the string-replacing expression bank with the
+# compiled one, using the expressions saved in res/demo.mid. The plot row is
+# 500 samples per expression, as drawn by the "Show Plot" checkbox.
+#
+# Run from the project root: python -m benchmarks.expression_bank
+
+import itertools
+import json
+import math
+import timeit
+
+import mido
+import numpy as np
+
+import lib.expression_bank as expression_bank
+
+FIELDS = ["new_x", "pitch", "duration", "rest", "velocity"]
+
+# Legacy bank
+
+legacy_namespace = {name: getattr(math, name) for name in dir(math) if not name.startswith("_")}
+
+def legacy_store(name: str, expression: str) -> None:
+    legacy_namespace[name] = lambda x : eval(expression.replace("\U0001d465", str(x)), legacy_namespace)
+
+def legacy_evaluate(expression: str, x_value: float | None = None):
+    return eval(expression.replace("\U0001d465", str(x_value)), legacy_namespace)
+
+# Benchmark
+
+def load_demo_settings() -> dict:
+    midi = mido.MidiFile("res/demo.mid")
+    return json.loads(midi.tracks[1][0].text)
+
+def time_per_call(function, number: int) -> float:
+    return min(timeit.repeat(function, number=number, repeat=5)) / number
+
+def main():
+    settings = load_demo_settings()
+
+    expression_bank.clear()
+    for i, expression in enumerate(settings["expressions"]):
+        letter = chr(ord("A") + i)
+        expression_bank.store(letter, expression)
+        legacy_store(letter, expression)
+
+    # Walk through x like the generation loop does, so nothing is memoized
+    x_values = itertools.cycle([i * math.pi / 2 for i in range(1024)])
+
+    print("{:<10} {:>14} {:>14} {:>9}".format("field", "before (us)", "after (us)", "speedup"))
+
+    for field in FIELDS:
+        expression = settings[field]
+        before = time_per_call(lambda: legacy_evaluate(expression, next(x_values)), 2000)
+        after = time_per_call(lambda: expression_bank.evaluate(expression, next(x_values)), 2000)
+        print("{:<10} {:>14.2f} {:>14.2f} {:>8.1f}x".format(field, before * 1e6, after * 1e6, before / after))
+
+    def legacy_step():
+        x_value = next(x_values)
+        for field in FIELDS:
+            legacy_evaluate(settings[field], x_value)
+
+    def step():
+        x_value = next(x_values)
+        for field in FIELDS:
+            expression_bank.evaluate(settings[field], x_value)
+
+    before = time_per_call(legacy_step, 1000)
+    after = time_per_call(step, 1000)
+    print("{:<10} {:>14.2f} {:>14.2f} {:>8.1f}x".format("note", before * 1e6, after * 1e6, before / after))
+
+    x = np.linspace(0, 10, 500)
+
+    def legacy_plot():
+        for expression in settings["expressions"]:
+            [legacy_evaluate(expression, x_value) for x_value in x]
+
+    def plot():
+        for expression in settings["expressions"]:
+            expression_bank.evaluate_array(expression, x)
+
+    before = time_per_call(legacy_plot, 10)
+    after = time_per_call(plot, 10)
+    print("{:<10} {:>14.2f} {:>14.2f} {:>8.1f}x".format("plot", before * 1e6, after * 1e6, before / after))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# A headless stand-in for the parts of Streamlit the pages use, for driving
+# many simulated sessions in one process without a browser or a server.
+# Each thread runs one session at a time; st.session_state and the widgets
+# resolve to that thread's session, as in a real Streamlit server.
+#
+# Widgets follow Streamlit's rules closely enough for load testing:
+# - values come from session state and defaults
+# - on_change and on_click callbacks run before the rerun that follows an interaction
+# - buttons are True only during the rerun after their click
+# - widget state is dropped for widgets that weren't rendered in a run, unless
+#   the script assigned it
+# Nothing is displayed, but figures are serialized to JSON as Streamlit would.
+#
+# pygame, pyperclip and filedialogs are replaced as well, so the pages run
+# with no audio device, clipboard or window system.
+
+import sys
+import threading
+import types
+from collections.abc import MutableMapping
+
+_local = threading.local()
+
+class Session:
+    def __init__(self, dialog_path: str = ""):
+        self.state = {}
+        self.widgets = {}
+        self.widget_keys = set()
+        self.rendered = set()
+        self.pending = []
+        self.clicked = None
+        self.dialog_path = dialog_path
+        self.messages = []
+
+    # Interactions, applied on the next rerun
+
+    def set(self, key: str, value):
+        self.state[key] = value
+        self.widget_keys.add(key)
+        self.pending.append(key)
+
+    def click(self, widget: str):
+        self.clicked = widget
+        self.pending.append(widget)
+
+    def run(self, code: types.CodeType, path: str):
+        _local.session = self
+        try:
+            for widget in self.pending:
+                callback = self.widgets.get(widget)
+                if callback is not None and callback[0] is not None:
+                    callback[0](*(callback[1] or ()), **(callback[2] or {}))
+            self.pending = []
+            self.widgets = {}
+            self.rendered = set()
+            self.messages = []
+            exec(code, {"__name__": "__main__", "__file__": path})
+        finally:
+            # Widget state of widgets that are gone is dropped
+            for key in self.widget_keys - self.rendered:
+                self.state.pop(key, None)
+            self.widget_keys &= self.rendered
+            self.clicked = None
+            _local.session = None
+
+def current() -> Session:
+    session = getattr(_local, "session", None)
+    if session is None:
+        raise RuntimeError("No headless session is running on this thread")
+    return session
+
+class _SessionStateProxy(MutableMapping):
+    def __getitem__(self, key):
+        return current().state[key]
+
+    def __setitem__(self, key, value):
+        session = current()
+        session.state[key] = value
+        # Assigned state survives even when its widget isn't rendered
+        session.widget_keys.discard(key)
+
+    def __delitem__(self, key):
+        del current().state[key]
+
+    def __iter__(self):
+        return iter(list(current().state))
+
+    def __len__(self):
+        return len(current().state)
+
+    def __getattr__(self, key):
+        try:
+            return current().state[key]
+        except KeyError:
+            raise AttributeError(key)
+
+# Widgets
+
+def _widget(kind: str, label: str, key: str | None, default, on_change, args, kwargs):
+    session = current()
+    widget = key if key is not None else "{}:{}".format(kind, label)
+    session.widgets[widget] = (on_change, args, kwargs)
+    if key is None:
+        return default
+    session.rendered.add(key)
+    if key not in session.state:
+        session.state[key] = default
+        session.widget_keys.add(key)
+    return session.state[key]
+
+def text_input(label, value="", max_chars=None, key=None, type="default", help=None, autocomplete=None, on_change=None, args=None, kwargs=None, **options):
+    return _widget("text_input", label, key, value, on_change, args, kwargs)
+
+def number_input(label, min_value=None, max_value=None, value=None, step=None, format=None, key=None, help=None, on_change=None, args=None, kwargs=None, **options):
+    if value is None:
+        value = min_value if min_value is not None else 0.0
+    return _widget("number_input", label, key, value, on_change, args, kwargs)
+
+def checkbox(label, value=False, key=None, help=None, on_change=None, args=None, kwargs=None, **options):
+    return _widget("checkbox", label, key, value, on_change, args, kwargs)
+
+def selectbox(label, options, index=0, format_func=str, key=None, help=None, on_change=None, args=None, kwargs=None, **other):
+    options = list(options)
+    default = options[index] if options else None
+    value = _widget("selectbox", label, key, default, on_change, args, kwargs)
+    if options and value not in options:
+        value = current().state[key] = default
+    return value
+
+def button(label, key=None, help=None, on_click=None, args=None, kwargs=None, **options):
+    session = current()
+    widget = key if key is not None else "button:{}".format(label)
+    session.widgets[widget] = (on_click, args, kwargs)
+    return session.clicked == widget
+
+# Elements
+
+def _message(kind: str):
+    def element(body=None, *args, **kwargs):
+        current().messages.append((kind, str(body)))
+    return element
+
+error = _message("error")
+warning = _message("warning")
+info = _message("info")
+success = _message("success")
+toast = _message("toast")
+exception = _message("exception")
+
+def _nothing(*args, **kwargs):
+    pass
+
+title = header = subheader = caption = markdown = write = divider = audio = _nothing
+
+def dataframe(data=None, *args, **kwargs):
+    if data is not None:
+        list(data)
+
+def plotly_chart(figure, *args, **kwargs):
+    figure.to_json()
+
+class _Container:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def progress(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(streamlit, name)
+
+def columns(spec, **kwargs):
+    return [_Container() for _ in range(spec if isinstance(spec, int) else len(spec))]
+
+def expander(label, expanded=False):
+    return _Container()
+
+def empty():
+    return _Container()
+
+# Replacements for the desktop dependencies
+
+_clipboard = [""]
+
+def _pyperclip() -> types.ModuleType:
+    module = types.ModuleType("pyperclip")
+    module.copy = lambda text: _clipboard.__setitem__(0, text)
+    module.paste = lambda: _clipboard[0]
+    return module
+
+def _filedialogs() -> types.ModuleType:
+    module = types.ModuleType("filedialogs")
+    module.open_file_dialog = lambda *args, **kwargs: current().dialog_path
+    module.save_file_dialog = lambda *args, **kwargs: current().dialog_path
+    return module
+
+def _pygame() -> tuple[types.ModuleType, types.ModuleType]:
+    pygame = types.ModuleType("pygame")
+    mixer = types.ModuleType("pygame.mixer")
+    initialized = [False]
+    mixer.get_init = lambda: initialized[0]
+    mixer.init = lambda *args, **kwargs: initialized.__setitem__(0, True)
+    mixer.music = types.SimpleNamespace(load=_nothing, play=_nothing, stop=_nothing)
+    pygame.mixer = mixer
+    return pygame, mixer
+
+streamlit = types.ModuleType("streamlit")
+
+def install():
+    # Replaces streamlit, pygame, pyperclip and filedialogs in sys.modules
+    for name in [
+        "text_input", "number_input", "checkbox", "selectbox", "button",
+        "error", "warning", "info", "success", "toast", "exception",
+        "title", "header", "subheader", "caption", "markdown", "write", "divider", "audio",
+        "dataframe", "plotly_chart", "columns", "expander", "empty",
+    ]:
+        setattr(streamlit, name, globals()[name])
+    streamlit.session_state = _SessionStateProxy()
+    streamlit.sidebar = _Container()
+    pygame, mixer = _pygame()
+    sys.modules.update(
+        {
+            "streamlit": streamlit,
+            "pyperclip": _pyperclip(),
+            "filedialogs": _filedialogs(),
+            "pygame": pygame,
+            "pygame.mixer": mixer,
+        }
+    )
+
+def compile_page(path: str) -> types.CodeType:
+    with open(path, encoding="utf-8") as f:
+        return compile(f.read(), path, "exec")
@@ -0,0 +1,223 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Drives simulated sessions through both pages at once and reports how rerun
+# latency and memory grow with the number of concurrent sessions. Runs
+# headless (see benchmarks/headless.py), one thread per session, as a
+# Streamlit server would.
+#
+# Run from the project root:
+#   python -m benchmarks.load_test --sessions 1,4,16 --rounds 3
+#   python -m benchmarks.load_test --sessions 8 --page scale_explorer --json load.json
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+import benchmarks.headless as headless
+
+headless.install()
+
+PAGES = {
+    "melody_creator": "pages/melody_creator.py",
+    "scale_explorer": "pages/scale_explorer.py",
+}
+
+# Interactions, each followed by a rerun. Values that depend on the session
+# number n make sessions generate different melodies.
+
+def melody_creator_scenario(n: int) -> list[tuple]:
+    return [
+        ("run",),
+        ("click", "button:Load Demo"),
+        ("set", "p_initial_x", str(n)),
+        ("set", "p_show_plot", True),
+        ("set", "p_expression_0", "sin(\U0001d465)*sin(\U0001d465*0.5)+sin(0.01*\U0001d465)*{}".format(n % 3 + 1)),
+        ("set", "p_plot_stop", 1000.0),
+        ("set", "p_show_plot", False),
+        ("click", "button:Play"),
+        ("set", "p_tempo", 90 + n),
+        ("set", "p_pitch", "A(\U0001d465) * 5"),
+        ("click", "button:Add Voice"),
+        ("set", "p_voice_1_initial_x", str(n + 1)),
+        ("click", "button:Save"),
+        ("click", "button:Remove Voice"),
+    ]
+
+def scale_explorer_scenario(n: int) -> list[tuple]:
+    return [
+        ("run",),
+        ("set", "scale_checkbox_{}".format(n % 11), True),
+        ("click", "rotate_scale_left"),
+        ("click", "rotate_scale_right"),
+        ("set", "scale_decimal", 1 + 2 * (n * 97 % 2048)),
+        ("set", "chord_checkbox_11", True),
+        ("set", "chord_checkbox_7", True),
+        ("click", "rotate_chord_right"),
+        ("click", "play_chord"),
+        ("click", "play_scale"),
+        ("click", "copy_scale"),
+        ("set", "scale_root", "D"),
+    ]
+
+SCENARIOS = {
+    "melody_creator": melody_creator_scenario,
+    "scale_explorer": scale_explorer_scenario,
+}
+
+def percentile(values: list[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def deep_size(value, seen: set | None = None) -> int:
+    # Rough size of session state, counting NumPy buffers and containers
+    if seen is None:
+        seen = set()
+    if id(value) in seen or isinstance(value, type) or callable(value):
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(getattr(value, "nbytes", None), int):
+        size += value.nbytes
+    if isinstance(value, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in value)
+    elif hasattr(value, "__dict__"):
+        size += deep_size(vars(value), seen)
+    return size
+
+def rss() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def run_session(page: str, n: int, rounds: int, code, latencies: list, errors: Counter, sessions: list, dialog_path: str):
+    session = headless.Session(dialog_path=dialog_path)
+    sessions.append(session)
+    for _ in range(rounds):
+        for action in SCENARIOS[page](n):
+            if action[0] == "set":
+                session.set(action[1], action[2])
+            elif action[0] == "click":
+                session.click(action[1])
+            started = time.perf_counter()
+            try:
+                session.run(code, PAGES[page])
+            except Exception as e:
+                errors["{}: {}".format(type(e).__name__, e)] += 1
+            latencies.append(time.perf_counter() - started)
+
+def load_test(page: str, count: int, rounds: int, trace_memory: bool = False) -> dict:
+    code = headless.compile_page(PAGES[page])
+    latencies = []
+    errors = Counter()
+    sessions = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        dialog_path = os.path.join(directory, "melody.mid")
+        rss_before = rss()
+        if trace_memory:
+            tracemalloc.start()
+        threads = [
+            threading.Thread(
+                target=run_session,
+                args=(page, n, rounds, code, latencies, errors, sessions, dialog_path),
+            )
+            for n in range(count)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        peak = None
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        rss_after = rss()
+
+    return {
+        "page": page,
+        "sessions": count,
+        "reruns": len(latencies),
+        "elapsed": elapsed,
+        "reruns_per_second": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p90": percentile(latencies, 0.9),
+        "p99": percentile(latencies, 0.99),
+        "max": max(latencies),
+        "state_bytes_per_session": sum(deep_size(session.state) for session in sessions) / count,
+        "peak_traced_bytes_per_session": peak / count if trace_memory else None,
+        "rss_growth_bytes_per_session": (rss_after - rss_before) / count,
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "errors": dict(errors),
+    }
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the pages with simulated concurrent sessions.")
+    parser.add_argument("--sessions", default="1,4,16", help="comma-separated numbers of concurrent sessions")
+    parser.add_argument("--rounds", type=int, default=2, help="times each session repeats its scenario")
+    parser.add_argument("--page", choices=[*PAGES, "both"], default="both")
+    parser.add_argument("--trace-memory", action="store_true", help="measure peak Python allocations, which slows every rerun")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    pages = list(PAGES) if args.page == "both" else [args.page]
+    results = []
+
+    print(
+        "{:<16} {:>8} {:>8} {:>9} {:>9} {:>9} {:>9} {:>12} {:>12}".format(
+            "page", "sessions", "reruns", "p50 (ms)", "p90 (ms)", "p99 (ms)", "max (ms)", "state (KB)", "memory (KB)"
+        )
+    )
+    for page in pages:
+        for count in (int(value) for value in args.sessions.split(",")):
+            result = load_test(page, count, args.rounds, args.trace_memory)
+            memory = result["peak_traced_bytes_per_session"] if args.trace_memory else result["rss_growth_bytes_per_session"]
+            results.append(result)
+            print(
+                "{:<16} {:>8} {:>8} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>12.1f} {:>12.1f}".format(
+                    page,
+                    count,
+                    result["reruns"],
+                    result["p50"] * 1e3,
+                    result["p90"] * 1e3,
+                    result["p99"] * 1e3,
+                    result["max"] * 1e3,
+                    result["state_bytes_per_session"] / 1024,
+                    memory / 1024,
+                )
+            )
+            for message, times in result["errors"].items():
+                print("    {} x {}".format(times, message))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
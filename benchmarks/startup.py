@@ -0,0 +1,116 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Measures cold start: how long a fresh interpreter takes to run the imports
+# at the top of each page, and then the lib work of that page's first rerun.
+# Streamlit itself isn't run; imports that aren't installed are listed and
+# skipped. The slowest imports come from python -X importtime.
+#
+# Run from the project root: python -m benchmarks.startup
+
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+
+PAGES = {
+    "melody_creator": "pages/melody_creator.py",
+    "scale_explorer": "pages/scale_explorer.py",
+}
+
+# The lib work of each page's first rerun. The Melody Creator runs with the
+# demo loaded, since an empty page does nothing.
+FIRST_RERUN = {
+    "melody_creator": """
+import lib.melody as melody
+import lib.playback as playback
+settings = melody.load_settings_from_file("res/demo.mid")
+mf, report = melody.generate_cached(settings)
+playback.midi_to_bytes(mf)
+""",
+    "scale_explorer": """
+import lib.chord_index as chord_index
+import lib.modes as modes
+import lib.scale_catalog as scale_catalog
+from lib.pitchclassset import PitchClassSet
+scale = PitchClassSet(2741)
+chord = PitchClassSet(145).mask(scale)
+modes.named_modes(2741)
+chord_index.chords_at_root(2741, 0)
+chord_index.scales_containing(int(chord.normalize(0)))
+scale_catalog.name(2741)
+scale_catalog.name(int(chord.normalize(0)))
+""",
+}
+
+MEASURE = """
+import json, sys, time
+started = time.perf_counter()
+missing = []
+for statement in {imports!r}:
+    try:
+        exec(statement)
+    except ImportError as e:
+        missing.append(e.name)
+imported = time.perf_counter()
+exec({first_rerun!r})
+finished = time.perf_counter()
+print(json.dumps({{"imports": imported - started, "first_rerun": finished - imported, "missing": missing}}))
+"""
+
+def page_imports(path: str) -> list[str]:
+    # The import statements at the top level of a page
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+def measure(page: str) -> dict:
+    code = MEASURE.format(imports=page_imports(PAGES[page]), first_rerun=FIRST_RERUN[page])
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=os.getcwd()
+    )
+    return json.loads(result.stdout)
+
+def slowest_imports(page: str, count: int = 8) -> list[tuple[int, str]]:
+    code = "\n".join(
+        "try:\n    {}\nexcept ImportError:\n    pass".format(statement) for statement in page_imports(PAGES[page])
+    )
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    times = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        # Only top-level packages, i.e. the least indented names
+        if match and len(match.group(2)) == 1:
+            times.append((int(match.group(1)), match.group(3)))
+    return sorted(times, reverse=True)[:count]
+
+def main():
+    for page in PAGES:
+        runs = [measure(page) for _ in range(5)]
+        imports = min(run["imports"] for run in runs)
+        first_rerun = min(run["first_rerun"] for run in runs)
+        print("{}: imports {:.1f} ms, first rerun {:.1f} ms".format(page, imports * 1e3, first_rerun * 1e3))
+        if runs[0]["missing"]:
+            print("  not installed: {}".format(", ".join(sorted(set(runs[0]["missing"])))))
+        for microseconds, name in slowest_imports(page):
+            print("  {:>8.1f} ms  {}".format(microseconds / 1e3, name))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Times the hot paths of both pages without Streamlit and saves the results as
+# a JSON baseline that later runs can be compared against.
+#
+# Run from the project root:
+#   python -m benchmarks.suite run -o baseline.json
+#   python -m benchmarks.suite compare baseline.json            (runs the suite again)
+#   python -m benchmarks.suite compare baseline.json new.json --threshold 5
+#
+# compare exits with status 1 if any benchmark got slower than the threshold.
+
+import argparse
+import datetime
+import fnmatch
+import io
+import itertools
+import json
+import math
+import platform
+import subprocess
+import sys
+import timeit
+
+import benchmarks.startup as startup
+import lib.circmath as circmath
+import lib.expression_bank as expression_bank
+import lib.melody as melody
+import lib.midi_stream as midi_stream
+import lib.scale_similarity as scale_similarity
+import lib.scale_sync as scale_sync
+from lib.pitchclassset import PitchClassSet
+
+DEMO_PATH = "res/demo.mid"
+FIELDS = ["new_x", "pitch", "duration", "rest", "velocity"]
+REPEAT = 5
+DEFAULT_THRESHOLD = 10.0
+NO_LIMITS = melody.Limits()
+
+# A long piece of sixteenth notes, for the generation loop at scale
+LONG_SETTINGS = {
+    "time_signature": {"numerator": 4, "denominator": 4},
+    "tempo": 120,
+    "length": 5000,
+    "scale": "C-2741",
+    "expressions": ["sin(\U0001d465) * 7", "A(\U0001d465 / 3) + cos(\U0001d465 / 5) * 3"],
+    "initial_x": "0",
+    "new_x": "\U0001d465 + 1",
+    "pitch": "B(\U0001d465)",
+    "duration": "0.25",
+    "rest": "A(\U0001d465) < -6",
+    "velocity": "90 + A(\U0001d465) * 4",
+}
+
+benchmarks = {}
+
+def benchmark(name: str):
+    # Registers a setup function returning (function, calls per timing)
+    def register(setup):
+        benchmarks[name] = setup
+        return setup
+    return register
+
+def load_demo_settings() -> dict:
+    return melody.load_settings_from_file(DEMO_PATH)
+
+def store(settings: dict):
+    melody.store_expressions(settings, expression_bank.default_bank)
+
+# Expressions
+
+@benchmark("expression.field")
+def _():
+    settings = load_demo_settings()
+    store(settings)
+    x_values = itertools.cycle([i * math.pi / 2 for i in range(1024)])
+    return lambda: expression_bank.evaluate(settings["pitch"], next(x_values)), 2000
+
+@benchmark("expression.note")
+def _():
+    settings = load_demo_settings()
+    store(settings)
+    x_values = itertools.cycle([i * math.pi / 2 for i in range(1024)])
+
+    def step():
+        x = next(x_values)
+        for field in FIELDS:
+            expression_bank.evaluate(settings[field], x)
+
+    return step, 1000
+
+@benchmark("expression.letter")
+def _():
+    store(LONG_SETTINGS)
+    letter = expression_bank.compile_expression("B(\U0001d465)")
+    x_values = itertools.cycle(range(1024))
+    return lambda: letter(next(x_values)), 2000
+
+@benchmark("expression.store")
+def _():
+    settings = load_demo_settings()
+
+    def rebuild():
+        store(settings)
+        expression_bank.build()
+
+    return rebuild, 200
+
+@benchmark("expression.plot_26")
+def _():
+    # 26 expressions over [0, 10000], as sampled for the plot
+    import lib.plot_sampling as plot_sampling
+
+    expression_bank.clear()
+    for i in range(26):
+        expression_bank.store(chr(ord("A") + i), "sin(\U0001d465 * {} / 7) * {}".format(i + 1, i))
+
+    def plot():
+        for i in range(26):
+            expression = chr(ord("A") + i) + "(\U0001d465)"
+            plot_sampling.sample_expression(lambda x: expression_bank.evaluate_array(expression, x), 0, 10000)
+
+    return plot, 1
+
+# Generation
+
+@benchmark("generation.demo")
+def _():
+    settings = load_demo_settings()
+    return lambda: melody.generate(settings, NO_LIMITS), 5
+
+@benchmark("generation.long")
+def _():
+    return lambda: melody.generate(LONG_SETTINGS, NO_LIMITS), 1
+
+@benchmark("generation.long_4_voices")
+def _():
+    settings = dict(LONG_SETTINGS)
+    settings["voices"] = [
+        {**{field: LONG_SETTINGS[field] for field in melody.FIELDS}, "initial_x": str(i * 10)} for i in range(1, 4)
+    ]
+    return lambda: melody.generate(settings, NO_LIMITS), 1
+
+@benchmark("generation.long_stream")
+def _():
+    def stream():
+        midi_stream.write_notes(io.BytesIO(), LONG_SETTINGS, melody.generate_notes(LONG_SETTINGS, NO_LIMITS))
+    return stream, 1
+
+# Scale Explorer
+
+def _scale_explorer_state() -> dict:
+    # The session state of the Scale Explorer after its first rerun
+    state = {
+        "p_scale_set": PitchClassSet(2741),
+        "p_scale_root_index": 0,
+        "p_chord_set": PitchClassSet(145),
+        "p_chord_root_index": 0,
+    }
+    scale_sync.sync_widgets(state)
+    scale_sync.sync_chord_decimal(state)
+    return state
+
+@benchmark("scale.sync_checkboxes")
+def _():
+    # What the page does after a scale checkbox click: rebuild the scale from
+    # the checkboxes, mask the chord to it and sync every widget back
+    state = _scale_explorer_state()
+    toggled = itertools.cycle([False, True])
+
+    def sync():
+        state["scale_checkbox_0"] = next(toggled)
+        scale_sync.update_scale_by_checkbox(state)
+        scale_sync.sync_widgets(state)
+
+    return sync, 2000
+
+@benchmark("scale.rotate")
+def _():
+    # The rotate buttons of the scale and the chord, in both directions
+    state = _scale_explorer_state()
+
+    def rotate():
+        scale_sync.rotate_scale_left(state)
+        scale_sync.rotate_scale_right(state)
+        scale_sync.rotate_chord_right(state)
+        scale_sync.rotate_chord_left(state)
+
+    return rotate, 5000
+
+@benchmark("scale.similar")
+def _():
+    scale_similarity.build()
+    scales = itertools.cycle(range(1, 4096, 2))
+    return lambda: scale_similarity.nearest(next(scales), 10), 2000
+
+@benchmark("scale.circmath")
+def _():
+    values = itertools.cycle(range(-24, 25))
+
+    def circ():
+        value = next(values)
+        circmath.circ_add(value, 7, 0, 12)
+        circmath.circ_sub(value, 7, 0, 12)
+
+    return circ, 10000
+
+# MIDI output
+
+@benchmark("midi.serialize_demo")
+def _():
+    settings = load_demo_settings()
+    notes = list(melody.generate_notes(settings, NO_LIMITS))
+
+    def serialize():
+        mf = melody.create_midi(settings)
+        for note in notes:
+            mf.addNote(0, 0, note.pitch, note.time, note.duration, note.velocity)
+        mf.writeFile(io.BytesIO())
+
+    return serialize, 20
+
+@benchmark("midi.serialize_long")
+def _():
+    notes = list(melody.generate_notes(LONG_SETTINGS, NO_LIMITS))
+
+    def serialize():
+        mf = melody.create_midi(LONG_SETTINGS)
+        for note in notes:
+            mf.addNote(0, 0, note.pitch, note.time, note.duration, note.velocity)
+        mf.writeFile(io.BytesIO())
+
+    return serialize, 1
+
+@benchmark("midi.stream_long")
+def _():
+    notes = list(melody.generate_notes(LONG_SETTINGS, NO_LIMITS))
+    return lambda: midi_stream.write_notes(io.BytesIO(), LONG_SETTINGS, notes), 1
+
+# Cold start, each timing a fresh interpreter (see benchmarks/startup.py)
+
+@benchmark("startup.melody_creator")
+def _():
+    return lambda: startup.measure("melody_creator"), 1
+
+@benchmark("startup.scale_explorer")
+def _():
+    return lambda: startup.measure("scale_explorer"), 1
+
+# Running and comparing
+
+def run(pattern: str = "*", repeat: int = REPEAT) -> dict:
+    results = {}
+    for name, setup in benchmarks.items():
+        if not fnmatch.fnmatch(name, pattern):
+            continue
+        function, number = setup()
+        function()
+        times = sorted(t / number for t in timeit.repeat(function, number=number, repeat=repeat))
+        results[name] = {"best": times[0], "median": times[len(times) // 2], "number": number, "repeat": repeat}
+        print("{:<26} {:>12.2f} us".format(name, times[0] * 1e6), file=sys.stderr)
+    return {"meta": metadata(), "results": results}
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+    }
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+    # Compares the best times and returns the names that regressed by more
+    # than threshold percent
+    regressions = []
+    print("{:<26} {:>12} {:>12} {:>9}".format("benchmark", "before (us)", "after (us)", "change"))
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            print("{:<26} {:>12} {:>12.2f} {:>9}".format(name, "-", result["best"] * 1e6, "new"))
+            continue
+        before = baseline["results"][name]["best"]
+        after = result["best"]
+        change = (after / before - 1) * 100
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{:<26} {:>12.2f} {:>12.2f} {:>+8.1f}%{}".format(name, before * 1e6, after * 1e6, change, flag))
+    return regressions
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the MusicTools hot paths.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks and save the results")
+    run_parser.add_argument("-o", "--output", help="JSON file to write the results to")
+    run_parser.add_argument("-k", "--filter", default="*", help="only run benchmarks matching this pattern")
+    run_parser.add_argument("--repeat", type=int, default=REPEAT)
+
+    compare_parser = subparsers.add_parser("compare", help="compare results against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current", nargs="?", help="saved results; the suite runs again if omitted")
+    compare_parser.add_argument("-k", "--filter", default="*", help="only run benchmarks matching this pattern")
+    compare_parser.add_argument("--repeat", type=int, default=REPEAT)
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown in percent")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run(args.filter, args.repeat)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        else:
+            json.dump(results, sys.stdout, indent=2)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if args.current:
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        current = run(args.filter, args.repeat)
+
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print("{} benchmark(s) slower than {}%: {}".format(len(regressions), args.threshold, ", ".join(regressions)))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
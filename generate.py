@@ -0,0 +1,163 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Generate melodies without the Streamlit UI.
+#
+#   python generate.py settings.json -o melody.mid
+#   python generate.py res/demo.mid -o demo.mid
+#   python generate.py --batch settings/ -o output/ --workers 8
+#   python generate.py res/demo.mid -o demo.mid --wav
+#   python generate.py long.json -o long.mid --stream
+#   python generate.py res/demo.mid --sweep grid.json -o sweep/ [--single-file]
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from lib import melody, midi_stream, playback, sweep, synth
+
+SETTINGS_EXTENSIONS = (".json", ".mid")
+
+# Unlike the UI, the command line doesn't limit generation unless asked to
+NO_LIMITS = melody.Limits()
+
+def render(
+    input_path: str,
+    output_path: str,
+    wav: bool = False,
+    stream: bool = False,
+    limits: melody.Limits = NO_LIMITS,
+) -> str:
+    settings = melody.load_settings_from_file(input_path)
+    report = melody.GenerationReport()
+    if stream and len(melody.get_voices(settings)) > 1:
+        raise melody.GenerationError("--stream only supports single-voice melodies")
+    if stream:
+        with open(output_path, "wb") as f:
+            midi_stream.write_notes(f, settings, melody.generate_notes(settings, limits, report))
+        if wav:
+            with open(output_path, "rb") as f:
+                notes = synth.notes_from_midi_bytes(f.read())
+            with open(os.path.splitext(output_path)[0] + ".wav", "wb") as f:
+                f.write(synth.to_wav_bytes(synth.render(notes)))
+    else:
+        mf = melody.generate(settings, limits, report)
+        playback.save_midi(mf, output_path)
+        if wav:
+            synth.write_wav(mf, os.path.splitext(output_path)[0] + ".wav")
+    if report.is_partial:
+        print("{}: {}".format(input_path, report.describe()), file=sys.stderr)
+    return output_path
+
+def batch(
+    input_dir: str,
+    output_dir: str,
+    workers: int | None,
+    wav: bool = False,
+    stream: bool = False,
+    limits: melody.Limits = NO_LIMITS,
+) -> int:
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = {}
+    for name in sorted(os.listdir(input_dir)):
+        stem, extension = os.path.splitext(name)
+        if extension.lower() not in SETTINGS_EXTENSIONS:
+            continue
+        input_path = os.path.join(input_dir, name)
+        output_path = os.path.join(output_dir, stem + ".mid")
+        if os.path.abspath(input_path) == os.path.abspath(output_path):
+            print("Skipping {}: output would overwrite it.".format(input_path), file=sys.stderr)
+            continue
+        jobs[input_path] = output_path
+
+    failures = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(render, input_path, output_path, wav, stream, limits): input_path
+            for input_path, output_path in jobs.items()
+        }
+        for future in as_completed(futures):
+            try:
+                print(future.result())
+            except Exception as e:
+                failures += 1
+                print("Failed {}: {}".format(futures[future], e), file=sys.stderr)
+
+    print("Rendered {} of {} files.".format(len(jobs) - failures, len(jobs)))
+    return 1 if failures else 0
+
+def run_sweep(
+    input_path: str,
+    grid_path: str,
+    output_dir: str,
+    workers: int | None,
+    single_file: bool,
+    limits: melody.Limits = NO_LIMITS,
+) -> int:
+    base = melody.load_settings_from_file(input_path)
+    with open(grid_path, encoding="utf-8") as file:
+        grids = json.load(file)
+    manifest = sweep.run(base, grids, output_dir, workers, single_file, limits)
+    for failure in manifest["failures"]:
+        print("Failed {}: {}".format(json.dumps(failure["parameters"], ensure_ascii=False), failure["error"]), file=sys.stderr)
+    rendered = len(manifest["tracks"] if single_file else manifest["files"])
+    print("Rendered {} of {} variants.".format(rendered, rendered + len(manifest["failures"])))
+    return 1 if manifest["failures"] else 0
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate MIDI melodies from Melody Creator settings.")
+    parser.add_argument("input", help="settings JSON or MIDI file with embedded settings, or a directory with --batch")
+    parser.add_argument("-o", "--output", help="output MIDI file, or output directory with --batch")
+    parser.add_argument("--batch", action="store_true", help="render every .json and .mid file in the input directory")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes in batch mode")
+    parser.add_argument("--wav", action="store_true", help="also render a WAV file next to each MIDI file")
+    parser.add_argument("--stream", action="store_true", help="write notes as they are generated, for very long pieces")
+    parser.add_argument("--sweep", metavar="GRID", help="JSON file of parameter grids to sweep over the input settings")
+    parser.add_argument("--single-file", action="store_true", help="write a sweep as the tracks of one MIDI file")
+    parser.add_argument("--max-iterations", type=int, help="stop generating after this many steps")
+    parser.add_argument("--max-notes", type=int, help="stop generating after this many notes")
+    parser.add_argument("--max-seconds", type=float, help="stop generating after this much wall-clock time")
+    args = parser.parse_args(argv)
+
+    limits = melody.Limits(args.max_iterations, args.max_notes, args.max_seconds)
+
+    if args.sweep:
+        try:
+            return run_sweep(args.input, args.sweep, args.output or "sweep", args.workers, args.single_file, limits)
+        except sweep.SweepError as e:
+            parser.error(str(e))
+
+    if args.batch:
+        return batch(args.input, args.output or "output", args.workers, args.wav, args.stream, limits)
+
+    output = args.output or os.path.splitext(os.path.basename(args.input))[0] + ".mid"
+    if os.path.abspath(output) == os.path.abspath(args.input):
+        parser.error("output would overwrite the input file")
+    try:
+        print(render(args.input, output, args.wav, args.stream, limits))
+    except Exception as e:
+        print("Failed {}: {}".format(args.input, e), file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import namedtuple
+from functools import cache, lru_cache
+
+import numpy as np
+
+import lib.scale_catalog as scale_catalog
+from lib.pitchclassset import CARDINALITY, MASK, PITCH_CLASSES, PitchClassSet, rotate
+
+# Chords and scales are root-relative decimals, so both always include bit 0.
+# A scale contains a chord at root r (semitones above the scale root) when
+# the chord transposed up by r is a subset of the scale.
+#
+# The base table lists, for every root-including mask, all of its
+# root-including submasks: the chords rooted on pitch class 0 of that mask.
+# The inverse table holds, for every chord and scale, a mask of the roots at
+# which the scale contains the chord.
+
+ChordEntry = namedtuple("ChordEntry", ["decimal", "roots", "name"])
+ScaleEntry = namedtuple("ScaleEntry", ["decimal", "roots", "name"])
+
+def _submasks(bits: int) -> tuple[int, ...]:
+    # Every submask of bits that keeps bit 0, in ascending order
+    rest = bits & ~1
+    submasks = []
+    sub = rest
+    while True:
+        submasks.append(sub | 1)
+        if sub == 0:
+            break
+        sub = (sub - 1) & rest
+    return tuple(reversed(submasks))
+
+@cache
+def _chords_at_root() -> tuple[tuple[int, ...], ...]:
+    return tuple(_submasks(bits) if bits & 1 else () for bits in range(MASK + 1))
+
+@cache
+def _scale_roots() -> np.ndarray:
+    # Row i is the chord 2i + 1 and column j the scale 2j + 1
+    decimals = np.arange(1, MASK + 1, 2, dtype=np.uint16)
+    shape = (len(decimals), len(decimals))
+    roots = np.zeros(shape, dtype=np.uint16)
+    common = np.empty(shape, dtype=np.uint16)
+    contains = np.empty(shape, dtype=bool)
+    for root in range(12):
+        required = ((decimals << root | decimals >> (12 - root)) & MASK | 1)[:, None]
+        np.bitwise_and(decimals, required, out=common)
+        np.equal(common, required, out=contains)
+        roots |= np.left_shift(contains, root, dtype=np.uint16)
+    return roots
+
+def _sort_key(entry) -> tuple[int, int]:
+    return CARDINALITY[entry.decimal], entry.decimal
+
+@lru_cache(maxsize=None)
+def _chords_in_scale(scale: int) -> tuple[ChordEntry, ...]:
+    chords_at_root = _chords_at_root()
+    roots = {}
+    for root in PITCH_CLASSES[scale]:
+        for chord in chords_at_root[int(PitchClassSet(scale).normalize(root))]:
+            roots.setdefault(chord, []).append(root)
+    entries = [
+        ChordEntry(chord, tuple(chord_roots), scale_catalog.name(chord))
+        for chord, chord_roots in roots.items()
+    ]
+    return tuple(sorted(entries, key=_sort_key))
+
+@lru_cache(maxsize=None)
+def _chords_at_root_entries(normalized: int, root: int) -> tuple[ChordEntry, ...]:
+    return tuple(ChordEntry(chord, (root,), scale_catalog.name(chord)) for chord in _chords_at_root()[normalized])
+
+@lru_cache(maxsize=None)
+def _scales_containing(chord: int) -> tuple[ScaleEntry, ...]:
+    roots = _scale_roots()[chord // 2]
+    columns = np.flatnonzero(roots)
+    return tuple(
+        ScaleEntry(scale, PITCH_CLASSES[scale_roots], scale_catalog.name(scale))
+        for scale, scale_roots in zip((2 * columns + 1).tolist(), roots[columns].tolist())
+    )
+
+def _root_relative(decimal: int) -> int:
+    if not 0 <= decimal <= MASK or not decimal & 1:
+        raise ValueError("Expected a root-including decimal between 1 and {}".format(MASK))
+    return decimal
+
+def chords_in_scale(scale: int) -> tuple[ChordEntry, ...]:
+    return _chords_in_scale(_root_relative(scale))
+
+def chords_at_root(scale: int, root: int) -> tuple[ChordEntry, ...]:
+    if root not in PitchClassSet(_root_relative(scale)):
+        return ()
+    return _chords_at_root_entries(rotate(scale, -root), root)
+
+def scales_containing(chord: int) -> tuple[ScaleEntry, ...]:
+    return _scales_containing(_root_relative(chord))
+
+def contains(scale: int, chord: int, root: int = 0) -> bool:
+    transposed = int(PitchClassSet(chord).transpose(root))
+    return transposed & scale == transposed
+
+def build():
+    # Precompute both tables, e.g. when warming up a server process
+    _chords_at_root()
+    _scale_roots()
+    scale_catalog.load()
@@ -0,0 +1,83 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import lib.scale_catalog as scale_catalog
+from lib.constants import EXTENSIONS
+from lib.pitchclassset import MASK, rotate
+
+# Tables for the chord panel of the Scale Explorer, computed once at import.
+#
+# The panel has one selectbox per generic interval in EXTENSIONS, whose state
+# is "Omit", one of its specific intervals, or "Both". Chords are relative to
+# their root, like the decimals in the chord index.
+#
+# Which options a selectbox offers depends on the scale seen from the chord
+# root, i.e. the scale rotated so the chord root is pitch class 0. Every
+# (scale, chord root) pair maps to one of those 4096 masks, so the options are
+# stored per mask rather than per pair.
+
+GENERIC_INTERVALS = tuple(EXTENSIONS)
+
+# The bits each state of each selectbox adds to the chord
+STATE_BITS = tuple(
+    {
+        "Omit": 0,
+        **{specific: 1 << interval for specific, interval in EXTENSIONS[generic].items()},
+        "Both": sum(1 << interval for interval in EXTENSIONS[generic].values()),
+    }
+    for generic in GENERIC_INTERVALS
+)
+
+def _column(generic: str, by_presence: dict) -> list:
+    # The entry for each mask depends only on which of the generic interval's
+    # two specific intervals it includes
+    first, second = EXTENSIONS[generic].values()
+    return [by_presence[bits >> first & 1, bits >> second & 1] for bits in range(MASK + 1)]
+
+def _states(generic: str) -> list[str]:
+    first, second = EXTENSIONS[generic]
+    return _column(generic, {(0, 0): "Omit", (1, 0): first, (0, 1): second, (1, 1): "Both"})
+
+def _options(generic: str) -> list[tuple[str, ...]]:
+    first, second = EXTENSIONS[generic]
+    return _column(
+        generic,
+        {(0, 0): ("Omit",), (1, 0): ("Omit", first), (0, 1): ("Omit", second), (1, 1): ("Omit", first, second, "Both")},
+    )
+
+# Selectbox states of every relative chord
+STATES = tuple(zip(*(_states(generic) for generic in GENERIC_INTERVALS)))
+
+# Selectbox options of every scale as seen from the chord root
+OPTIONS = tuple(zip(*(_options(generic) for generic in GENERIC_INTERVALS)))
+
+def options(scale: int, root: int) -> tuple[tuple[str, ...], ...]:
+    return OPTIONS[rotate(scale, -root)]
+
+def states(chord: int) -> tuple[str, ...]:
+    return STATES[chord]
+
+def chord(states: tuple[str, ...]) -> int:
+    # The relative chord of the selectbox states, always including its root
+    bits = 1
+    for state_bits, state in zip(STATE_BITS, states):
+        bits |= state_bits[state]
+    return bits
+
+def name(chord: int) -> str:
+    return scale_catalog.name(chord)
@@ -16,19 +16,541 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from math import *
+import ast
+import builtins
+import copy
+import math
+import threading
+from collections import OrderedDict
+from functools import cache, lru_cache, reduce
+from types import CodeType
+from typing import TYPE_CHECKING, Callable
 
-saved_names = []
+if TYPE_CHECKING:
+    import numpy as np
 
-def store(name: str, expression: str) -> None:
-    globals()[name] = lambda x : eval(expression.replace("\U0001d465", str(x)))
-    if name not in saved_names:
-        saved_names.append(name)
+# Python normalizes identifiers with NFKC, so "𝑥" is parsed as the name "x".
+# Every expression is compiled once into a function of that variable.
+#
+# Stored expressions (the letters A-Z) form a dependency graph. It is rebuilt
+# lazily after the bank changes: letters are compiled in topological order,
+# letters on a cycle are replaced by functions raising ExpressionCycleError,
+# and any sub-expression not depending on x is folded into a constant.
+#
+# Each ExpressionBank has its own letters, so sessions sharing a server don't
+# see each other's definitions. The compiled code is shared between banks:
+# it is cached by the expression and the definitions of the letters it uses.
+# The module-level functions use a default bank.
+#
+# A bank given builtins evaluates its expressions with only those, and
+# rejects attribute access and names starting with an underscore, through
+# which an expression could reach the real ones. It's meant for expressions
+# from other programs, as in the HTTP service.
 
-def clear():
-    for x in saved_names:
-        del globals()[x]
-    saved_names.clear()
+COMPILE_CACHE_SIZE = 512
 
-def evaluate(expression: str, x_value: float | None = None):
-    return eval(expression.replace("\U0001d465", str(x_value)))
\ No newline at end of file
+FOLDABLE_BUILTINS = {"abs", "bool", "float", "int", "max", "min", "pow", "round"}
+
+SAFE_BUILTINS = {
+    name: getattr(builtins, name)
+    for name in [
+        "abs", "all", "any", "bool", "complex", "divmod", "enumerate", "filter", "float", "int", "len",
+        "list", "map", "max", "min", "pow", "range", "reversed", "round", "sorted", "sum", "tuple", "zip",
+    ]
+}
+
+MATH_NAMES = {name for name in dir(math) if not name.startswith("_")}
+
+# Their cost grows without bound with their arguments, so they're left for
+# evaluation to run, if it ever does
+UNFOLDABLE_MATH_NAMES = {"comb", "factorial", "perm"}
+
+# x used to be substituted into the expression as text, so a negative x on
+# the left of ** read as -(|x| ** y): at x = -1, x**2 was -1**2 = -1. Such
+# powers are compiled into a call to POWER_OF_X, which keeps that reading so
+# saved melodies still sound the same.
+POWER_OF_X = "_power_of_x"
+
+def _power_of_x(x, y):
+    if isinstance(x, (int, float)) and (x < 0 or (x == 0 and math.copysign(1.0, x) < 0)):
+        return -((-x) ** y)
+    return x ** y
+
+scalar_namespace = {name: getattr(math, name) for name in MATH_NAMES}
+scalar_namespace[POWER_OF_X] = _power_of_x
+
+# Math functions replaced by their NumPy equivalents when evaluating a whole
+# array of x values at once. Anything not listed falls through to math and,
+# if that fails on an array, to scalar evaluation. NumPy is only imported once
+# something is evaluated over an array, e.g. for a plot.
+
+@cache
+def vector_namespace() -> dict:
+    import numpy as np
+
+    numpy_functions = {
+        "acos": np.arccos,
+        "acosh": np.arccosh,
+        "asin": np.arcsin,
+        "asinh": np.arcsinh,
+        "atan": np.arctan,
+        "atan2": np.arctan2,
+        "atanh": np.arctanh,
+        "cbrt": np.cbrt,
+        "ceil": np.ceil,
+        "copysign": np.copysign,
+        "cos": np.cos,
+        "cosh": np.cosh,
+        "degrees": np.degrees,
+        "exp": np.exp,
+        "exp2": np.exp2,
+        "expm1": np.expm1,
+        "fabs": np.fabs,
+        "floor": np.floor,
+        "fmod": np.fmod,
+        "hypot": np.hypot,
+        "isfinite": np.isfinite,
+        "isinf": np.isinf,
+        "isnan": np.isnan,
+        "ldexp": np.ldexp,
+        "log": lambda x, base=math.e: np.log(x) / np.log(base),
+        "log10": np.log10,
+        "log1p": np.log1p,
+        "log2": np.log2,
+        "pow": np.power,
+        "radians": np.radians,
+        # math.remainder rounds the quotient half to even, as np.round does;
+        # np.remainder is floor modulo
+        "remainder": lambda x, y: x - y * np.round(x / y),
+        "sin": np.sin,
+        "sinh": np.sinh,
+        "sqrt": np.sqrt,
+        "tan": np.tan,
+        "tanh": np.tanh,
+        "trunc": np.trunc,
+        "max": lambda *args: reduce(np.maximum, args) if len(args) > 1 else max(*args),
+        "min": lambda *args: reduce(np.minimum, args) if len(args) > 1 else min(*args),
+        POWER_OF_X: lambda x, y: np.where(np.signbit(x) & ~np.isnan(x), -((-x) ** y), x ** y),
+    }
+    return {**scalar_namespace, **numpy_functions}
+
+class ExpressionCycleError(ValueError):
+    def __init__(self, cycle: list[str]):
+        self.cycle = cycle
+        super().__init__("Expressions refer to each other in a cycle: " + " -> ".join(cycle))
+
+# Parsing and folding
+
+@lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def _parse(expression: str) -> tuple[ast.expr, frozenset[str]]:
+    tree = ast.parse(expression.strip(), mode="eval").body
+    names = frozenset(node.id for node in ast.walk(tree) if isinstance(node, ast.Name))
+    return tree, names
+
+class _ConstantFolder(ast.NodeTransformer):
+    def __init__(self, letters: set[str], namespace: dict):
+        self.allowed_names = (MATH_NAMES - UNFOLDABLE_MATH_NAMES) | FOLDABLE_BUILTINS | letters
+        self.namespace = namespace
+
+    def visit(self, node):
+        node = super().visit(node)
+        if isinstance(node, ast.expr) and not isinstance(node, ast.Constant) and self.is_foldable(node):
+            try:
+                expression = ast.fix_missing_locations(ast.Expression(body=node))
+                value = eval(compile(expression, "<expression>", "eval"), self.namespace)
+            except Exception:
+                return node
+            if type(value) in (bool, int, float, complex):
+                return ast.copy_location(ast.Constant(value=value), node)
+        return node
+
+    # New scopes may rebind names, so their bodies are left untouched
+
+    def visit_Lambda(self, node):
+        return node
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = visit_Lambda
+
+    # Only the operands that always run are folded on their own. The others
+    # may be in a branch evaluation never takes.
+
+    def visit_IfExp(self, node):
+        node.test = self.visit(node.test)
+        return node
+
+    def visit_BoolOp(self, node):
+        node.values[0] = self.visit(node.values[0])
+        return node
+
+    def is_foldable(self, node: ast.expr) -> bool:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name):
+                if child.id not in self.allowed_names:
+                    return False
+            elif isinstance(child, ast.Call):
+                if not isinstance(child.func, ast.Name):
+                    return False
+            elif isinstance(child, ast.BinOp):
+                # Don't hang the build on something like 10**10**10
+                if (
+                    isinstance(child.op, (ast.Pow, ast.LShift))
+                    and not (
+                        isinstance(child.right, ast.Constant)
+                        and isinstance(child.right.value, (int, float))
+                        and abs(child.right.value) <= 1024
+                    )
+                ):
+                    return False
+            elif isinstance(child, (ast.Lambda, ast.NamedExpr, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+                return False
+        return True
+
+class _PowerOfX(ast.NodeTransformer):
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        # A parenthesized x, as in (x)**2, starts after the power does
+        if (
+            isinstance(node.op, ast.Pow)
+            and isinstance(node.left, ast.Name)
+            and node.left.id == "x"
+            and (node.left.lineno, node.left.col_offset) == (node.lineno, node.col_offset)
+        ):
+            call = ast.Call(func=ast.Name(id=POWER_OF_X, ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+            return ast.copy_location(call, node)
+        return node
+
+def _fold(expression: str, key: tuple, namespace: dict) -> ast.expr:
+    # key pins the definitions of the letters the expression refers to, which
+    # the folded constants may depend on
+    tree, _ = _parse(expression)
+    if any(isinstance(node, ast.NamedExpr) for node in ast.walk(tree)):
+        return _PowerOfX().visit(copy.deepcopy(tree))
+    letters = {name for name, letter_key in key if letter_key is not None}
+    return _PowerOfX().visit(_ConstantFolder(letters, namespace).visit(copy.deepcopy(tree)))
+
+def _check_restricted(expression: str):
+    tree, _ = _parse(expression)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute):
+            raise SyntaxError("Attribute access is not allowed")
+        if isinstance(node, ast.Name) and node.id.startswith("_"):
+            raise SyntaxError("Names starting with an underscore are not allowed")
+
+def _lambda(arguments: list[str], body: ast.expr, defaults: list[ast.expr] = []) -> ast.Lambda:
+    return ast.Lambda(
+        args=ast.arguments(
+            posonlyargs=[],
+            args=[ast.arg(arg=argument) for argument in arguments],
+            kwonlyargs=[],
+            kw_defaults=[],
+            defaults=defaults,
+        ),
+        body=body,
+    )
+
+class _CodeCache:
+    # Least recently used compiled code, shared by every bank. Two threads may
+    # compile the same entry at once; either result is correct.
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, build: Callable[[], CodeType]) -> CodeType:
+        with self._lock:
+            code = self._entries.get(key)
+            if code is not None:
+                self._entries.move_to_end(key)
+                return code
+        code = build()
+        with self._lock:
+            self._entries[key] = code
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return code
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_code_cache = _CodeCache(COMPILE_CACHE_SIZE)
+
+def _compile_code(expression: str, key: tuple, namespace: dict) -> CodeType:
+    # lambda x=None: <expression>
+    def build():
+        function = ast.Expression(body=_lambda(["x"], _fold(expression, key, namespace), [ast.Constant(value=None)]))
+        return compile(ast.fix_missing_locations(function), "<expression>", "eval")
+    return _code_cache.get(("expression", expression, key), build)
+
+def _compile_batch_code(groups: tuple, keys: tuple, namespace: dict) -> CodeType:
+    # lambda x0, x1, ...: ((lambda x: (e, ...))(x0), (lambda x: (e, ...))(x1), ...)
+    # so each group sees its own x without renaming anything in the expressions
+    def build():
+        calls = [
+            ast.Call(
+                func=_lambda(
+                    ["x"],
+                    ast.Tuple(
+                        elts=[_fold(expression, key, namespace) for expression, key in zip(group, group_keys)],
+                        ctx=ast.Load(),
+                    ),
+                ),
+                args=[ast.Name(id="x" + str(i), ctx=ast.Load())],
+                keywords=[],
+            )
+            for i, (group, group_keys) in enumerate(zip(groups, keys))
+        ]
+        function = ast.Expression(
+            body=_lambda(["x" + str(i) for i in range(len(groups))], ast.Tuple(elts=calls, ctx=ast.Load()))
+        )
+        return compile(ast.fix_missing_locations(function), "<expression>", "eval")
+    return _code_cache.get(("batch", groups, keys), build)
+
+# Dependency graph
+
+def _sort(graph: dict[str, set[str]]) -> tuple[list[str], list[list[str]]]:
+    # Depth-first topological sort that records every back edge as a cycle
+    order = []
+    cycles = []
+    state = {}
+    path = []
+
+    def visit(name):
+        state[name] = "visiting"
+        path.append(name)
+        for dependency in sorted(graph[name]):
+            if state.get(dependency) == "visiting":
+                cycles.append(path[path.index(dependency):] + [dependency])
+            elif dependency not in state:
+                visit(dependency)
+        path.pop()
+        state[name] = "done"
+        order.append(name)
+
+    for name in graph:
+        if name not in state:
+            visit(name)
+
+    return order, cycles
+
+def _memoize(function: Callable) -> Callable:
+    # Repeated references to a letter with the same argument, as in
+    # A(x) + A(x) or A(B(x)) * B(x), are evaluated once. The last call is kept
+    # as one tuple, so threads sharing the bank never see half an update.
+    # 0.0 and -0.0 compare equal but are different arguments, e.g. to copysign.
+    last = None
+    def memoized(x=None):
+        nonlocal last
+        entry = last
+        if (
+            entry is not None
+            and type(x) is type(entry[0])
+            and type(x) in (int, float)
+            and x == entry[0]
+            and (x or math.copysign(1.0, x) == math.copysign(1.0, entry[0]))
+        ):
+            return entry[1]
+        y = function(x)
+        last = (x, y)
+        return y
+    return memoized
+
+def _memoize_vector(function: Callable) -> Callable:
+    last = None
+    def memoized(x=None):
+        nonlocal last
+        entry = last
+        if entry is not None and x is entry[0]:
+            return entry[1]
+        y = function(x)
+        last = (x, y)
+        return y
+    return memoized
+
+def _raising(error: Exception) -> Callable:
+    def raise_error(x=None):
+        raise error
+    return raise_error
+
+# Bank
+
+class ExpressionBank:
+    def __init__(self, builtins: dict | None = None):
+        self.sources = {}
+        self.builtins = builtins
+        self.namespace = dict(scalar_namespace)
+        if builtins is not None:
+            self.namespace["__builtins__"] = builtins
+        # Created by the first evaluation over an array
+        self.vector_namespace = None
+        self._lock = threading.RLock()
+        self._is_built = True
+        self._cycles = []
+        self._letter_keys = {}
+        self._compiled = {}
+        self._compiled_vector = {}
+
+    def _key(self, expression: str) -> tuple:
+        _, names = _parse(expression)
+        return tuple((name, self._letter_keys.get(name)) for name in sorted(names & self.sources.keys()))
+
+    def _function(self, expression: str, key: tuple, vector: bool) -> Callable:
+        if self.builtins is not None:
+            _check_restricted(expression)
+        code = _compile_code(expression, key, self.namespace)
+        return eval(code, self.vector_namespace if vector else self.namespace)
+
+    def _deferred(self, expression: str, key: tuple, vector: bool) -> Callable:
+        # Keep the old behaviour of failing when called rather than when stored
+        def deferred(x=None):
+            return self._function(expression, key, vector)(x)
+        return deferred
+
+    def dependency_graph(self) -> dict[str, set[str]]:
+        graph = {}
+        for name, expression in self.sources.items():
+            try:
+                _, names = _parse(expression)
+            except SyntaxError:
+                names = frozenset()
+            graph[name] = set(names & self.sources.keys())
+        return graph
+
+    def build(self):
+        with self._lock:
+            graph = self.dependency_graph()
+            order, cycles = _sort(graph)
+
+            broken = {}
+            for cycle in cycles:
+                for name in cycle:
+                    broken.setdefault(name, ExpressionCycleError(cycle))
+
+            self._letter_keys.clear()
+            self._compiled.clear()
+            self._compiled_vector.clear()
+
+            for name in order:
+                for dependency in graph[name]:
+                    if dependency in broken and name not in broken:
+                        broken[name] = broken[dependency]
+                if name in broken:
+                    self._letter_keys[name] = None
+                    self.namespace[name] = _raising(broken[name])
+                    if self.vector_namespace is not None:
+                        self.vector_namespace[name] = self.namespace[name]
+                    continue
+                expression = self.sources[name]
+                key = ()
+                try:
+                    key = self._key(expression)
+                    self.namespace[name] = _memoize(self._function(expression, key, False))
+                    if self.vector_namespace is not None:
+                        self.vector_namespace[name] = _memoize_vector(self._function(expression, key, True))
+                    self._letter_keys[name] = (expression, key)
+                except SyntaxError:
+                    self._letter_keys[name] = None
+                    self.namespace[name] = self._deferred(expression, key, False)
+                    if self.vector_namespace is not None:
+                        self.vector_namespace[name] = self._deferred(expression, key, True)
+
+            self._cycles = cycles
+            self._is_built = True
+
+    def cycles(self) -> list[list[str]]:
+        if not self._is_built:
+            self.build()
+        return list(self._cycles)
+
+    def compile_expression(self, expression: str) -> Callable:
+        if not self._is_built:
+            self.build()
+        function = self._compiled.get(expression)
+        if function is None:
+            if len(self._compiled) >= COMPILE_CACHE_SIZE:
+                self._compiled.clear()
+            function = self._compiled[expression] = self._function(expression, self._key(expression), False)
+        return function
+
+    def compile_vector_expression(self, expression: str) -> Callable:
+        if self.vector_namespace is None:
+            with self._lock:
+                if self.vector_namespace is None:
+                    self.vector_namespace = dict(vector_namespace())
+                    if self.builtins is not None:
+                        self.vector_namespace["__builtins__"] = self.builtins
+                    self._is_built = False
+        if not self._is_built:
+            self.build()
+        function = self._compiled_vector.get(expression)
+        if function is None:
+            if len(self._compiled_vector) >= COMPILE_CACHE_SIZE:
+                self._compiled_vector.clear()
+            function = self._compiled_vector[expression] = self._function(expression, self._key(expression), True)
+        return function
+
+    def compile_batch(self, groups: list[list[str]]) -> Callable:
+        # One call evaluates every expression of every group, group i at the x
+        # passed as argument i, and returns a tuple of value tuples
+        if not self._is_built:
+            self.build()
+        groups = tuple(tuple(group) for group in groups)
+        if self.builtins is not None:
+            for group in groups:
+                for expression in group:
+                    _check_restricted(expression)
+        keys = tuple(tuple(self._key(expression) for expression in group) for group in groups)
+        return eval(_compile_batch_code(groups, keys, self.namespace), self.namespace)
+
+    def store(self, name: str, expression: str) -> None:
+        with self._lock:
+            self.sources[name] = expression
+            self._is_built = False
+
+    def clear(self):
+        with self._lock:
+            for name in self.sources:
+                self.namespace.pop(name, None)
+                if self.vector_namespace is not None:
+                    self.vector_namespace.pop(name, None)
+            self.sources.clear()
+            self._is_built = False
+
+    def evaluate(self, expression: str, x_value: float | None = None):
+        function = self._compiled.get(expression) if self._is_built else None
+        if function is None:
+            function = self.compile_expression(expression)
+        return function(x_value)
+
+    def evaluate_array(self, expression: str, x_values: "np.ndarray") -> "np.ndarray":
+        import numpy as np
+
+        x_values = np.asarray(x_values, dtype=float)
+        try:
+            with np.errstate(all="ignore"):
+                y_values = np.asarray(self.compile_vector_expression(expression)(x_values))
+            if y_values.dtype.kind not in "biuf":
+                raise TypeError("Expression did not evaluate to real numbers")
+            return np.broadcast_to(y_values, x_values.shape).astype(float)
+        except (SyntaxError, ExpressionCycleError):
+            raise
+        except Exception:
+            # Not vectorizable (e.g. int(), conditionals, math-only functions)
+            return np.array(
+                [self.evaluate(expression, x_value) for x_value in x_values.tolist()],
+                dtype=float,
+            )
+
+default_bank = ExpressionBank()
+
+dependency_graph = default_bank.dependency_graph
+build = default_bank.build
+cycles = default_bank.cycles
+compile_expression = default_bank.compile_expression
+compile_vector_expression = default_bank.compile_vector_expression
+compile_batch = default_bank.compile_batch
+store = default_bank.store
+clear = default_bank.clear
+evaluate = default_bank.evaluate
+evaluate_array = default_bank.evaluate_array
@@ -0,0 +1,351 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict, namedtuple
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Callable, Iterator
+
+from midiutil import MIDIFile
+
+import lib.expression_bank as expression_bank
+import lib.settings_reader as settings_reader
+from lib.constants import PITCHNAMES
+from lib.pitchclassset import PitchClassSet
+
+# Settings are the dictionaries produced by compile_settings in the Melody
+# Creator and embedded as a text event in every saved MIDI file.
+
+FIELDS = {
+    "initial_x": "Initial X",
+    "new_x": "New X",
+    "pitch": "Pitch",
+    "duration": "Duration",
+    "rest": "Rest",
+    "velocity": "Velocity",
+}
+
+# Fields evaluated at every step, in order
+STEP_FIELDS = ["new_x", "pitch", "duration", "rest", "velocity"]
+
+# Voice n plays on its own track and channel, skipping the drum channel
+CHANNELS = [channel for channel in range(16) if channel != 9]
+
+GENERATION_CACHE_SIZE = 32
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+Note = namedtuple("Note", ["time", "duration", "pitch", "velocity"])
+
+# Limits stop runaway generation, e.g. a Duration expression that quantizes
+# to a tiny step. None disables a limit.
+
+Limits = namedtuple("Limits", ["iterations", "notes", "seconds"], defaults=(None, None, None))
+
+DEFAULT_LIMITS = Limits(iterations=1000000, notes=100000, seconds=10.0)
+
+LIMIT_LABELS = {"iterations": "iteration", "notes": "note", "seconds": "time"}
+
+PROGRESS_INTERVAL = 1000
+
+# The shortest power of two that is at least one tick (1/960 beat) long.
+# Shorter notes would start and end on the same tick, which MIDIUtil can't
+# write.
+MIN_DURATION = 2 ** -9
+
+@dataclass
+class GenerationReport:
+    iterations: int = 0
+    notes: int = 0
+    time: float = 0
+    x: float | None = None
+    elapsed: float = 0.0
+    limit: str | None = None
+
+    @property
+    def is_partial(self) -> bool:
+        return self.limit is not None
+
+    def describe(self) -> str:
+        return "Generation hit the {} limit at x = {} after {} notes and {} beats.".format(
+            LIMIT_LABELS[self.limit], self.x, self.notes, self.time
+        )
+
+class GenerationError(Exception):
+    pass
+
+class GenerationCache:
+    # Least recently used store of generated melodies, shared by every
+    # session in the process
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+generation_cache = GenerationCache(GENERATION_CACHE_SIZE)
+
+def quantize_duration(duration: float) -> float:
+    return max(MIN_DURATION, 2 ** round(math.log2(duration)))
+
+def get_pitchclassset_from_scale(scale: str) -> set[int]:
+    root_str, decimal_str = scale.split("-", 1)
+
+    root = PITCHNAMES.index(root_str)
+
+    if root == -1:
+        raise Exception("Invalid scale")
+
+    try:
+        pitchclassset = PitchClassSet(int(decimal_str))
+    except:
+        raise Exception("Invalid scale")
+
+    return [x + root - 3 for x in pitchclassset]
+
+def degree_to_pitch(degree: int, pitchclassset: set[int]) -> int:
+    octave = math.floor(degree / len(pitchclassset)) + 4
+    return pitchclassset[degree % len(pitchclassset)] + 12 * octave
+
+def load_settings_from_file(path_to_file: str) -> dict:
+    if path_to_file.lower().endswith(".json"):
+        with open(path_to_file, encoding="utf-8") as file:
+            return json.load(file)
+    return settings_reader.read_settings(path_to_file)
+
+def store_expressions(settings: dict, bank: expression_bank.ExpressionBank | None = None) -> expression_bank.ExpressionBank:
+    # Each generation gets its own bank unless given one, so concurrent
+    # generations never see each other's letters
+    if bank is None:
+        bank = expression_bank.ExpressionBank()
+    bank.clear()
+    for i, expression in enumerate(settings["expressions"]):
+        bank.store(chr(ord("A") + i), expression)
+    return bank
+
+def get_voices(settings: dict) -> list[dict]:
+    # The first voice is the settings themselves, so melodies saved before
+    # voices existed are single-voice melodies
+    return [settings] + settings.get("voices", [])
+
+def field_label(field: str, voice: int = 0) -> str:
+    if voice == 0:
+        return "**{}**".format(FIELDS[field])
+    return "**{}** (voice {})".format(FIELDS[field], voice + 1)
+
+def check_settings(settings: dict):
+    for i, voice in enumerate(get_voices(settings)):
+        for field in FIELDS:
+            if voice.get(field, "") == "":
+                raise GenerationError("{} is unspecified.".format(field_label(field, i)))
+
+def create_midi(settings: dict, tracks: int = 1) -> MIDIFile:
+    # An empty MIDIFile with the settings, tempo and time signature
+    mf = MIDIFile(tracks)
+    mf.addText(0, 0, json.dumps(settings))
+    mf.addTempo(0, 0, settings["tempo"])
+    mf.addTimeSignature(
+        0,
+        0,
+        settings["time_signature"]["numerator"],
+        int(math.log2(settings["time_signature"]["denominator"])),
+        24,
+    )
+    return mf
+
+def _evaluate_step(bank: expression_bank.ExpressionBank, voice: dict, x, number: int) -> tuple:
+    # Evaluates the fields one at a time, so a failure names the field
+    values = []
+    for field, convert in zip(STEP_FIELDS, (float, int, float, bool, int)):
+        try:
+            values.append(convert(bank.evaluate(voice[field], x)))
+        except:
+            raise GenerationError("{} failed to evaluate at x = {}".format(field_label(field, number), x))
+    return tuple(values)
+
+def generate_voices(
+    settings: dict,
+    limits: Limits = DEFAULT_LIMITS,
+    report: GenerationReport | None = None,
+    progress: Callable[[GenerationReport, float], None] | None = None,
+    bank: expression_bank.ExpressionBank | None = None,
+) -> Iterator[tuple[int, Note]]:
+    # Yields (voice, note). Every voice takes one step per round, and the
+    # fields of all voices still playing are evaluated in one batched call.
+    # The batch only saves call overhead. Each voice still does all of its own
+    # evaluation and per-note work, so N voices take nearly N times as long
+    # as one. Evaluating voices that share an expression over a NumPy array
+    # only broke even at about 64 voices, more than there are MIDI channels,
+    # so it isn't done.
+    # Stops early, without raising, when a limit is reached. The report then
+    # names the limit and the x at which generation stopped.
+    if report is None:
+        report = GenerationReport()
+
+    check_settings(settings)
+    bank = store_expressions(settings, bank)
+
+    voices = get_voices(settings)
+    pitchclassset = get_pitchclassset_from_scale(settings["scale"])
+
+    xs = []
+    for i, voice in enumerate(voices):
+        try:
+            xs.append(bank.evaluate(voice["initial_x"]))
+        except:
+            raise GenerationError("{} failed to evaluate.".format(field_label("initial_x", i)))
+
+    times = [0] * len(voices)
+    active = [i for i in range(len(voices)) if times[i] < settings["length"]]
+    batches = {}
+    started = perf_counter()
+
+    while active:
+        report.x = xs[active[0]]
+        report.time = times[active[0]]
+        report.elapsed = perf_counter() - started
+
+        if limits.iterations is not None and report.iterations >= limits.iterations:
+            report.limit = "iterations"
+            break
+        if limits.notes is not None and report.notes >= limits.notes:
+            report.limit = "notes"
+            break
+        if limits.seconds is not None and report.elapsed >= limits.seconds:
+            report.limit = "seconds"
+            break
+
+        if progress is not None and report.iterations % PROGRESS_INTERVAL < len(active):
+            progress(report, min(1.0, min(times[i] for i in active) / settings["length"]))
+
+        try:
+            batch = batches.get(tuple(active))
+            if batch is None:
+                batch = batches[tuple(active)] = bank.compile_batch(
+                    [[voices[i][field] for field in STEP_FIELDS] for i in active]
+                )
+            steps = [
+                (float(new_x), int(pitch), float(duration), bool(is_rest), int(velocity))
+                for new_x, pitch, duration, is_rest, velocity in batch(*[xs[i] for i in active])
+            ]
+        except:
+            steps = [_evaluate_step(bank, voices[i], xs[i], i) for i in active]
+
+        report.iterations += len(active)
+
+        for i, (new_x, pitch, duration, is_rest, velocity) in zip(active, steps):
+            if duration > 0:
+                if not math.isfinite(duration):
+                    raise GenerationError("{} is not finite at x = {}".format(field_label("duration", i), xs[i]))
+                duration = quantize_duration(duration)
+                if not is_rest:
+                    pitch = min(127, max(0, degree_to_pitch(pitch, pitchclassset)))
+                    velocity = max(0, min(127, velocity))
+                    report.notes += 1
+                    yield i, Note(times[i], duration, pitch, velocity)
+            else:
+                duration = 0
+
+            xs[i] = new_x
+            times[i] += duration
+
+        active = [i for i in active if times[i] < settings["length"]]
+    else:
+        report.x = xs[0]
+        report.time = min(times)
+        report.elapsed = perf_counter() - started
+
+    if progress is not None:
+        progress(report, 1.0)
+
+def generate_notes(
+    settings: dict,
+    limits: Limits = DEFAULT_LIMITS,
+    report: GenerationReport | None = None,
+    progress: Callable[[GenerationReport, float], None] | None = None,
+) -> Iterator[Note]:
+    # Notes in time order, for writers that handle a single track
+    if len(get_voices(settings)) > 1:
+        raise GenerationError("Only single-voice melodies can be generated note by note.")
+    for _, note in generate_voices(settings, limits, report, progress):
+        yield note
+
+def generate(
+    settings: dict,
+    limits: Limits = DEFAULT_LIMITS,
+    report: GenerationReport | None = None,
+    progress: Callable[[GenerationReport, float], None] | None = None,
+    bank: expression_bank.ExpressionBank | None = None,
+) -> MIDIFile:
+    check_settings(settings)
+    mf = create_midi(settings, len(get_voices(settings)))
+    for voice, note in generate_voices(settings, limits, report, progress, bank):
+        mf.addNote(voice, CHANNELS[voice % len(CHANNELS)], note.pitch, note.time, note.duration, note.velocity)
+    return mf
+
+def settings_hash(settings: dict) -> str:
+    canonical = json.dumps(settings, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def generate_cached(
+    settings: dict,
+    limits: Limits = DEFAULT_LIMITS,
+    progress: Callable[[GenerationReport, float], None] | None = None,
+) -> tuple[MIDIFile, GenerationReport]:
+    key = settings_hash({"settings": settings, "limits": list(limits)})
+    result = generation_cache.get(key)
+    if result is None:
+        report = GenerationReport()
+        result = (generate(settings, limits, report, progress), report)
+        generation_cache.put(key, result)
+    return result
+
+def cache_info() -> CacheInfo:
+    return generation_cache.info()
@@ -0,0 +1,199 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+import sqlite3
+from collections import namedtuple
+
+import lib.settings_reader as settings_reader
+
+# A SQLite index over a directory of melodies saved by the Melody Creator.
+# Only files whose modification time or size changed since the last update
+# are read again, and queries never open a MIDI file.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS melodies (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    has_settings INTEGER NOT NULL,
+    scale TEXT,
+    scale_root TEXT,
+    scale_decimal INTEGER,
+    tempo REAL,
+    length REAL,
+    numerator INTEGER,
+    denominator INTEGER,
+    initial_x TEXT,
+    new_x TEXT,
+    pitch TEXT,
+    duration TEXT,
+    rest TEXT,
+    velocity TEXT,
+    expressions TEXT,
+    settings TEXT
+);
+CREATE INDEX IF NOT EXISTS melodies_scale ON melodies (scale);
+CREATE INDEX IF NOT EXISTS melodies_scale_decimal ON melodies (scale_decimal);
+CREATE INDEX IF NOT EXISTS melodies_tempo ON melodies (tempo);
+CREATE INDEX IF NOT EXISTS melodies_length ON melodies (length);
+"""
+
+EXPRESSION_COLUMNS = ["initial_x", "new_x", "pitch", "duration", "rest", "velocity", "expressions"]
+
+UpdateResult = namedtuple("UpdateResult", ["added", "updated", "removed", "unchanged"])
+
+Melody = namedtuple("Melody", ["path", "scale", "tempo", "length", "settings"])
+
+def _row(path: str, stat: os.stat_result, settings: dict | None) -> tuple:
+    if settings is None:
+        return (path, stat.st_mtime, stat.st_size, 0) + (None,) * 15
+    scale = settings.get("scale", "")
+    root, _, decimal = scale.partition("-")
+    return (
+        path,
+        stat.st_mtime,
+        stat.st_size,
+        1,
+        scale,
+        root,
+        int(decimal) if decimal.isdigit() else None,
+        settings.get("tempo"),
+        settings.get("length"),
+        settings.get("time_signature", {}).get("numerator"),
+        settings.get("time_signature", {}).get("denominator"),
+        settings.get("initial_x"),
+        settings.get("new_x"),
+        settings.get("pitch"),
+        settings.get("duration"),
+        settings.get("rest"),
+        settings.get("velocity"),
+        json.dumps(settings.get("expressions", []), ensure_ascii=False),
+        json.dumps(settings),
+    )
+
+class MelodyLibrary:
+    def __init__(self, database_path: str):
+        self.connection = sqlite3.connect(database_path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, directory: str) -> UpdateResult:
+        directory = os.path.abspath(directory)
+        prefix = directory + os.sep
+        known = {
+            path: (mtime, size)
+            for path, mtime, size in self.connection.execute("SELECT path, mtime, size FROM melodies")
+            if path.startswith(prefix)
+        }
+
+        added = updated = unchanged = 0
+        seen = set()
+        rows = []
+
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if not name.lower().endswith(".mid"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                seen.add(path)
+                if known.get(path) == (stat.st_mtime, stat.st_size):
+                    unchanged += 1
+                    continue
+                try:
+                    settings = settings_reader.read_settings(path)
+                except Exception:
+                    settings = None
+                rows.append(_row(path, stat, settings))
+                if path in known:
+                    updated += 1
+                else:
+                    added += 1
+
+        removed = [(path,) for path in known if path not in seen]
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO melodies VALUES ({})".format(", ".join("?" * 19)),
+                rows,
+            )
+            self.connection.executemany("DELETE FROM melodies WHERE path = ?", removed)
+
+        return UpdateResult(added, updated, len(removed), unchanged)
+
+    def query(
+        self,
+        scale: str | None = None,
+        scale_decimal: int | None = None,
+        root: str | None = None,
+        min_tempo: float | None = None,
+        max_tempo: float | None = None,
+        min_length: float | None = None,
+        max_length: float | None = None,
+        expression: str | None = None,
+        limit: int | None = None,
+    ) -> list[Melody]:
+        conditions = ["has_settings = 1"]
+        parameters = []
+
+        for column, operator, value in (
+            ("scale", "=", scale),
+            ("scale_decimal", "=", scale_decimal),
+            ("scale_root", "=", root),
+            ("tempo", ">=", min_tempo),
+            ("tempo", "<=", max_tempo),
+            ("length", ">=", min_length),
+            ("length", "<=", max_length),
+        ):
+            if value is not None:
+                conditions.append("{} {} ?".format(column, operator))
+                parameters.append(value)
+
+        if expression is not None:
+            conditions.append(
+                "(" + " OR ".join("instr({}, ?) > 0".format(column) for column in EXPRESSION_COLUMNS) + ")"
+            )
+            parameters += [expression] * len(EXPRESSION_COLUMNS)
+
+        sql = "SELECT path, scale, tempo, length, settings FROM melodies WHERE {} ORDER BY path".format(
+            " AND ".join(conditions)
+        )
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+
+        return [
+            Melody(path, scale, tempo, length, json.loads(settings))
+            for path, scale, tempo, length, settings in self.connection.execute(sql, parameters)
+        ]
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM melodies WHERE has_settings = 1").fetchone()[0]
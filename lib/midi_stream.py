@@ -0,0 +1,121 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import heapq
+import json
+import math
+import struct
+from typing import BinaryIO, Iterable
+
+from lib.melody import Note
+
+# Writes a MIDI file while notes are being generated, instead of collecting
+# every event in a MIDIFile first. The layout matches what MIDIUtil writes
+# for the Melody Creator: a conductor track with the time signature and
+# tempo, and a note track starting with the settings text.
+#
+# Memory is bounded by the number of notes sounding at once. The note track
+# length is patched into its header on close, so the file must be seekable.
+
+TICKS_PER_BEAT = 960
+
+def _variable_length(value: int) -> bytes:
+    data = [value & 0x7F]
+    value >>= 7
+    while value:
+        data.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(data))
+
+def _meta(delta: int, kind: int, data: bytes) -> bytes:
+    return _variable_length(delta) + bytes([0xFF, kind]) + _variable_length(len(data)) + data
+
+def _chunk(data: bytes) -> bytes:
+    return b"MTrk" + struct.pack(">I", len(data)) + data
+
+class StreamingMidiWriter:
+    def __init__(self, file: BinaryIO, settings: dict, ticks_per_beat: int = TICKS_PER_BEAT):
+        self.file = file
+        self.ticks_per_beat = ticks_per_beat
+        self.tick = 0
+        self.note_offs = []
+        self.sequence = 0
+        self.closed = False
+
+        self.file.write(b"MThd" + struct.pack(">IHHH", 6, 1, 2, ticks_per_beat))
+
+        denominator = int(math.log2(settings["time_signature"]["denominator"]))
+        conductor = (
+            _meta(0, 0x58, bytes([settings["time_signature"]["numerator"], denominator, 24, 8]))
+            + _meta(0, 0x51, struct.pack(">I", int(60000000 / settings["tempo"]))[1:])
+            + _meta(0, 0x2F, b"")
+        )
+        self.file.write(_chunk(conductor))
+
+        self.file.write(b"MTrk")
+        self.length_position = self.file.tell()
+        self.file.write(b"\0\0\0\0")
+        self.length = 0
+        self._write(_meta(0, 0x01, json.dumps(settings).encode("utf-8")))
+
+    def _write(self, data: bytes):
+        self.file.write(data)
+        self.length += len(data)
+
+    def _event(self, tick: int, data: bytes):
+        self._write(_variable_length(tick - self.tick) + data)
+        self.tick = tick
+
+    def _flush_note_offs(self, until: int):
+        while self.note_offs and self.note_offs[0][0] <= until:
+            tick, _, pitch, velocity = heapq.heappop(self.note_offs)
+            self._event(tick, bytes([0x80, pitch, velocity]))
+
+    def add_note(self, note: Note):
+        start = round(note.time * self.ticks_per_beat)
+        end = round((note.time + note.duration) * self.ticks_per_beat)
+        self._flush_note_offs(start)
+        self._event(start, bytes([0x90, note.pitch, note.velocity]))
+        heapq.heappush(self.note_offs, (end, self.sequence, note.pitch, note.velocity))
+        self.sequence += 1
+
+    def close(self):
+        if self.closed:
+            return
+        self._flush_note_offs(math.inf)
+        self._write(_meta(0, 0x2F, b""))
+        end = self.file.tell()
+        self.file.seek(self.length_position)
+        self.file.write(struct.pack(">I", self.length))
+        self.file.seek(end)
+        self.file.flush()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def write_notes(file: BinaryIO, settings: dict, notes: Iterable[Note]) -> int:
+    count = 0
+    with StreamingMidiWriter(file, settings) as writer:
+        for note in notes:
+            writer.add_note(note)
+            count += 1
+    return count
@@ -0,0 +1,81 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import namedtuple
+
+import lib.scale_catalog as scale_catalog
+from lib.pitchclassset import MASK, ROTATE_UP, rotate
+
+# Mode families of all 4096 pitch class sets, computed once at import.
+#
+# Every set belongs to the family of its rotations. The family is represented
+# by its smallest rotation (the necklace representative), which always
+# includes the root. The modes of a family are its root-including rotations,
+# ordered by repeatedly moving the root up to the next member, starting from
+# the representative. Sets without a root have no mode index (-1).
+
+Mode = namedtuple("Mode", ["index", "decimal", "name"])
+
+REPRESENTATIVE = tuple(min(rotate(bits, n) for n in range(12)) for bits in range(MASK + 1))
+
+FAMILY_REPRESENTATIVES = tuple(sorted(set(REPRESENTATIVE)))
+
+_family_ids = {representative: family for family, representative in enumerate(FAMILY_REPRESENTATIVES)}
+
+FAMILY = tuple(_family_ids[representative] for representative in REPRESENTATIVE)
+
+def _modes(representative: int) -> tuple[int, ...]:
+    modes = [representative]
+    while True:
+        mode = ROTATE_UP[modes[-1]]
+        if mode == representative:
+            return tuple(modes)
+        modes.append(mode)
+
+FAMILY_MODES = tuple(_modes(representative) for representative in FAMILY_REPRESENTATIVES)
+
+_mode_index = [-1] * (MASK + 1)
+for _family_modes in FAMILY_MODES:
+    for _index, _mode in enumerate(_family_modes):
+        _mode_index[_mode] = _index
+
+MODE_INDEX = tuple(_mode_index)
+
+del _mode_index, _family_modes, _index, _mode
+
+def representative(bits: int) -> int:
+    return REPRESENTATIVE[bits]
+
+def family(bits: int) -> int:
+    return FAMILY[bits]
+
+def mode_index(bits: int) -> int:
+    return MODE_INDEX[bits]
+
+def modes(bits: int) -> tuple[int, ...]:
+    return FAMILY_MODES[FAMILY[bits]]
+
+def mode(bits: int, index: int) -> int:
+    family_modes = modes(bits)
+    return family_modes[index % len(family_modes)]
+
+def named_modes(bits: int) -> list[Mode]:
+    return [
+        Mode(index, decimal, scale_catalog.name(decimal))
+        for index, decimal in enumerate(modes(bits))
+    ]
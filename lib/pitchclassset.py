@@ -0,0 +1,147 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from typing import Iterable, Iterator
+
+# A set of pitch classes stored as a 12-bit mask, where bit n is the pitch
+# class n semitones above the root. The decimal of a scale, as used in the
+# Scale Explorer and in "C-2741", is the mask itself.
+
+MASK = 0xFFF
+
+# Pitch classes and cardinality of every mask, computed once
+PITCH_CLASSES = tuple(
+    tuple(n for n in range(12) if bits >> n & 1) for bits in range(MASK + 1)
+)
+CARDINALITY = tuple(len(pitch_classes) for pitch_classes in PITCH_CLASSES)
+
+def rotate(bits: int, semitones: int) -> int:
+    semitones %= 12
+    return ((bits << semitones) | (bits >> (12 - semitones))) & MASK
+
+def _mode_above(bits: int) -> int:
+    # Rotate so the lowest member above the root becomes the root
+    if CARDINALITY[bits] <= 1:
+        return bits
+    return rotate(bits, -PITCH_CLASSES[bits & ~1][0])
+
+def _mode_below(bits: int) -> int:
+    if CARDINALITY[bits] <= 1:
+        return bits
+    return rotate(bits, -PITCH_CLASSES[bits & ~1][-1])
+
+# The neighbouring modes of every mask, as used by the rotate buttons
+ROTATE_UP = tuple(_mode_above(bits) for bits in range(MASK + 1))
+ROTATE_DOWN = tuple(_mode_below(bits) for bits in range(MASK + 1))
+
+class PitchClassSet:
+    __slots__ = ("bits",)
+
+    def __init__(self, bits: int = 0):
+        if not 0 <= bits <= MASK:
+            raise ValueError("Pitch class set must be between 0 and {}".format(MASK))
+        self.bits = bits
+
+    @classmethod
+    def from_pitch_classes(cls, pitch_classes: Iterable[int]) -> "PitchClassSet":
+        bits = 0
+        for pitch_class in pitch_classes:
+            bits |= 1 << (pitch_class % 12)
+        return cls(bits)
+
+    @classmethod
+    def from_binary(cls, binary: str) -> "PitchClassSet":
+        return cls(int(binary, 2))
+
+    # Value semantics
+
+    def __int__(self) -> int:
+        return self.bits
+
+    __index__ = __int__
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PitchClassSet) and self.bits == other.bits
+
+    def __hash__(self) -> int:
+        return hash(self.bits)
+
+    def __repr__(self) -> str:
+        return "PitchClassSet({})".format(self.bits)
+
+    def __len__(self) -> int:
+        return CARDINALITY[self.bits]
+
+    def __bool__(self) -> bool:
+        return self.bits != 0
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(PITCH_CLASSES[self.bits])
+
+    def __contains__(self, pitch_class: int) -> bool:
+        return self.bits >> (pitch_class % 12) & 1 == 1
+
+    def __and__(self, other: "PitchClassSet") -> "PitchClassSet":
+        return PitchClassSet(self.bits & int(other))
+
+    def __or__(self, other: "PitchClassSet") -> "PitchClassSet":
+        return PitchClassSet(self.bits | int(other))
+
+    def __xor__(self, other: "PitchClassSet") -> "PitchClassSet":
+        return PitchClassSet(self.bits ^ int(other))
+
+    def binary(self) -> str:
+        return format(self.bits, "012b")
+
+    # Manipulation
+
+    def toggle(self, pitch_class: int) -> "PitchClassSet":
+        return PitchClassSet(self.bits ^ (1 << (pitch_class % 12)))
+
+    def mask(self, other: "PitchClassSet") -> "PitchClassSet":
+        return self & other
+
+    def transpose(self, semitones: int) -> "PitchClassSet":
+        return PitchClassSet(rotate(self.bits, semitones))
+
+    def normalize(self, root: int) -> "PitchClassSet":
+        # Make root the new pitch class 0
+        return PitchClassSet(rotate(self.bits, -root))
+
+    def next_above(self, pitch_class: int) -> int:
+        # The closest member above pitch_class, wrapping around the octave
+        for step in range(1, 13):
+            if self.bits >> ((pitch_class + step) % 12) & 1:
+                return (pitch_class + step) % 12
+        return -1
+
+    def next_below(self, pitch_class: int) -> int:
+        for step in range(1, 13):
+            if self.bits >> ((pitch_class - step) % 12) & 1:
+                return (pitch_class - step) % 12
+        return -1
+
+    def lowest(self) -> int:
+        return PITCH_CLASSES[self.bits][0] if self.bits else -1
+
+    def rotate_up(self) -> "PitchClassSet":
+        # The mode starting on the next member above the root
+        return PitchClassSet(ROTATE_UP[self.bits])
+
+    def rotate_down(self) -> "PitchClassSet":
+        return PitchClassSet(ROTATE_DOWN[self.bits])
@@ -0,0 +1,63 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import io
+import threading
+import weakref
+
+from midiutil import MIDIFile
+
+# MIDI files are serialized once into memory and the same bytes are used for
+# playback and saving. Nothing is written to the working directory, so
+# sessions sharing a server can't overwrite each other's files.
+
+_serialized = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+_playing = None
+
+def midi_to_bytes(mf: MIDIFile) -> bytes:
+    with _lock:
+        data = _serialized.get(mf)
+        if data is None:
+            buffer = io.BytesIO()
+            mf.writeFile(buffer)
+            data = _serialized[mf] = buffer.getvalue()
+        return data
+
+def save_midi(mf: MIDIFile, path: str):
+    data = midi_to_bytes(mf)
+    with open(path, "wb") as f:
+        f.write(data)
+
+def play_bytes(data: bytes):
+    global _playing
+    import pygame.mixer
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+    # The mixer streams from the buffer, so keep it alive while playing
+    _playing = io.BytesIO(data)
+    pygame.mixer.music.load(_playing, "mid")
+    pygame.mixer.music.play()
+
+def play_midi(mf: MIDIFile):
+    play_bytes(midi_to_bytes(mf))
+
+def stop():
+    import pygame.mixer
+    if pygame.mixer.get_init():
+        pygame.mixer.music.stop()
@@ -0,0 +1,105 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from typing import Callable
+
+import numpy as np
+
+# Samples expressions for the plot. A coarse uniform grid is refined where the
+# curve bends or jumps, down to a fraction of a pixel, and the result is
+# decimated to the minimum and maximum of each pixel column, so straight lines
+# stay cheap and fast oscillations still show their full envelope.
+
+PLOT_WIDTH = 1000
+PLOT_HEIGHT = 450
+INITIAL_SAMPLES = 129
+OVERSAMPLING = 8
+
+def _tolerance(y: np.ndarray) -> float:
+    # Half a pixel of the initial vertical range
+    finite = y[np.isfinite(y)]
+    if finite.size == 0:
+        return 0.0
+    span = float(finite.max() - finite.min())
+    return span / PLOT_HEIGHT / 2 if span > 0 else 1e-9
+
+def sample(
+    function: Callable[[np.ndarray], np.ndarray],
+    start: float,
+    stop: float,
+    width: int = PLOT_WIDTH,
+) -> tuple[np.ndarray, np.ndarray]:
+    x = np.linspace(start, stop, INITIAL_SAMPLES)
+    y = np.asarray(function(x), dtype=float)
+    tolerance = _tolerance(y)
+    smallest_step = (stop - start) / (width * OVERSAMPLING)
+
+    # Intervals to split, by the index of their left end. An interval is split
+    # again when its midpoint is off the straight line between its ends, or
+    # when the curve turns finite or infinite inside it.
+    active = np.arange(len(x) - 1)
+    while active.size:
+        left_y, right_y = y[active], y[active + 1]
+        mid_x = (x[active] + x[active + 1]) / 2
+        mid_y = np.asarray(function(mid_x), dtype=float)
+
+        with np.errstate(all="ignore"):
+            bent = np.abs(mid_y - (left_y + right_y) / 2) > tolerance
+        broken = (np.isfinite(left_y) != np.isfinite(right_y)) | (np.isfinite(left_y) != np.isfinite(mid_y))
+        refine = (bent | broken) & ((x[active + 1] - x[active]) / 2 > smallest_step)
+
+        x = np.insert(x, active + 1, mid_x)
+        y = np.insert(y, active + 1, mid_y)
+
+        # Each interval's left end moved right by the number of midpoints
+        # inserted before it
+        left = active[refine] + np.flatnonzero(refine)
+        active = np.sort(np.concatenate([left, left + 1]))
+    return x, y
+
+def decimate(x: np.ndarray, y: np.ndarray, width: int = PLOT_WIDTH) -> tuple[np.ndarray, np.ndarray]:
+    # Keeps the first, last, lowest and highest point of each pixel column,
+    # and the points on either side of a gap
+    if len(x) <= 4 * width:
+        return x, y
+    columns = np.minimum(((x - x[0]) / (x[-1] - x[0]) * width).astype(int), width - 1)
+    finite = np.isfinite(y)
+
+    boundaries = np.flatnonzero(np.diff(columns)) + 1
+    firsts = np.concatenate([[0], boundaries])
+    lasts = np.concatenate([boundaries - 1, [len(x) - 1]])
+
+    # Sorting by column, then y, puts each column's minimum first and its
+    # maximum last, with infinities and NaNs pushed to the end
+    ranked = np.where(finite, y, np.inf)
+    order = np.lexsort((ranked, columns))
+    finite_counts = np.add.reduceat(finite.astype(int), firsts)
+    lowest = order[firsts]
+    highest = order[firsts + np.maximum(finite_counts, 1) - 1]
+
+    gaps = np.flatnonzero(finite[:-1] != finite[1:])
+    keep = np.unique(np.concatenate([firsts, lasts, lowest, highest, gaps, gaps + 1]))
+    return x[keep], y[keep]
+
+def sample_expression(
+    function: Callable[[np.ndarray], np.ndarray],
+    start: float,
+    stop: float,
+    width: int = PLOT_WIDTH,
+) -> tuple[np.ndarray, np.ndarray]:
+    return decimate(*sample(function, start, stop, width), width)
@@ -0,0 +1,70 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import os
+from functools import cache
+
+# res/scale_names.txt has one line per scale that includes its root, i.e.
+# every odd decimal from 1 to 4095. Line n names the decimals 2n and 2n + 1.
+
+SCALE_NAMES_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "res", "scale_names.txt")
+
+class _Catalog:
+    __slots__ = ("names", "decimals_by_name", "sorted_names")
+
+    def __init__(self, names: list[str]):
+        self.names = names
+        self.decimals_by_name = {}
+        for index, scale_name in enumerate(names):
+            self.decimals_by_name.setdefault(scale_name.casefold(), []).append(2 * index + 1)
+        self.sorted_names = sorted(self.decimals_by_name)
+
+@cache
+def _catalog() -> _Catalog:
+    with open(SCALE_NAMES_PATH, encoding="utf-8") as file:
+        return _Catalog(file.read().splitlines())
+
+def load():
+    _catalog()
+
+def name(decimal: int) -> str:
+    return _catalog().names[decimal // 2]
+
+def decimals(scale_name: str) -> list[int]:
+    return list(_catalog().decimals_by_name.get(scale_name.casefold(), []))
+
+def search(query: str, prefix: bool = False, limit: int | None = None) -> list[tuple[int, str]]:
+    catalog = _catalog()
+    query = query.casefold()
+    results = []
+
+    if prefix:
+        start = bisect.bisect_left(catalog.sorted_names, query)
+        for key in catalog.sorted_names[start:]:
+            if not key.startswith(query):
+                break
+            for decimal in catalog.decimals_by_name[key]:
+                results.append((decimal, name(decimal)))
+        results.sort()
+    else:
+        for index, scale_name in enumerate(catalog.names):
+            if query in scale_name.casefold():
+                results.append((2 * index + 1, scale_name))
+
+    return results[:limit] if limit is not None else results
@@ -0,0 +1,116 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from collections import namedtuple
+from functools import cache
+
+import numpy as np
+
+import lib.scale_catalog as scale_catalog
+from lib.pitchclassset import CARDINALITY, MASK, PITCH_CLASSES
+
+# Nearest neighbours among the 2048 root-including scales. The distance
+# between two scales combines three features:
+#
+#   hamming      pitch classes in one scale but not the other
+#   interval     L1 distance between the interval vectors, which count each
+#                interval class (1 to 6 semitones) between pairs of notes,
+#                and so are the same for every mode and inversion of a scale
+#   cardinality  difference in number of notes
+#
+# The features of every scale are computed once into arrays, so a query is
+# a few vector operations and a sort over 2048 rows.
+
+HAMMING_WEIGHT = 1.0
+INTERVAL_WEIGHT = 0.5
+CARDINALITY_WEIGHT = 1.0
+
+Neighbour = namedtuple("Neighbour", ["decimal", "name", "distance", "hamming", "interval_distance", "cardinality_difference"])
+
+def interval_vector(bits: int) -> tuple[int, ...]:
+    vector = [0] * 6
+    pitch_classes = PITCH_CLASSES[bits]
+    for index, lower in enumerate(pitch_classes):
+        for upper in pitch_classes[index + 1:]:
+            interval = upper - lower
+            vector[min(interval, 12 - interval) - 1] += 1
+    return tuple(vector)
+
+class _Tables:
+    __slots__ = ("scales", "interval_vectors", "cardinalities", "scale_interval_vectors", "scale_cardinalities")
+
+    def __init__(self):
+        self.scales = np.arange(1, MASK + 1, 2, dtype=np.int64)
+        self.interval_vectors = np.array([interval_vector(bits) for bits in range(MASK + 1)], dtype=np.int64)
+        self.cardinalities = np.array(CARDINALITY, dtype=np.int64)
+        # One row per interval class over the candidates, which numpy sums
+        # much faster than short rows per scale
+        self.scale_interval_vectors = np.ascontiguousarray(self.interval_vectors[self.scales].T)
+        self.scale_cardinalities = self.cardinalities[self.scales]
+
+@cache
+def _tables() -> _Tables:
+    return _Tables()
+
+def build():
+    _tables()
+    scale_catalog.load()
+
+def nearest(
+    scale: int,
+    limit: int = 10,
+    include_self: bool = False,
+    hamming_weight: float = HAMMING_WEIGHT,
+    interval_weight: float = INTERVAL_WEIGHT,
+    cardinality_weight: float = CARDINALITY_WEIGHT,
+) -> list[Neighbour]:
+    if not 0 <= scale <= MASK:
+        raise ValueError("Scale must be between 0 and {}".format(MASK))
+    tables = _tables()
+    scales = tables.scales
+
+    # The Hamming distance is the cardinality of the XOR of the two masks
+    hamming = tables.cardinalities[scales ^ scale]
+    interval_distance = np.abs(tables.scale_interval_vectors - tables.interval_vectors[scale][:, None]).sum(axis=0)
+    cardinality_difference = np.abs(tables.scale_cardinalities - CARDINALITY[scale])
+    distance = hamming_weight * hamming + interval_weight * interval_distance + cardinality_weight * cardinality_difference
+
+    if not include_self and scale & 1:
+        distance[scale // 2] = np.inf
+
+    # Stable, so ties are ordered by decimal
+    if limit < len(scales):
+        # Keep every row that ties with the last one before sorting
+        cutoff = np.partition(distance, limit - 1)[limit - 1] if limit > 0 else -np.inf
+        candidates = np.flatnonzero(distance <= cutoff)
+    else:
+        candidates = np.arange(len(scales))
+    order = candidates[np.argsort(distance[candidates], kind="stable")][:max(limit, 0)]
+
+    order = order[distance[order] != np.inf]
+    names = scale_catalog.name
+    return [
+        Neighbour(decimal, names(decimal), *features)
+        for decimal, *features in zip(
+            scales[order].tolist(),
+            distance[order].tolist(),
+            hamming[order].tolist(),
+            interval_distance[order].tolist(),
+            cardinality_difference[order].tolist(),
+        )
+    ]
@@ -0,0 +1,140 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from typing import MutableMapping
+
+import lib.chord_tables as chord_tables
+from lib.constants import PITCHNAMES
+from lib.pitchclassset import PitchClassSet
+
+# Keeps the widgets of the Scale Explorer in sync with the scale and chord.
+# Every function takes the session state, or any mapping with the same keys,
+# so the page logic can also run outside Streamlit.
+#
+# p_scale_set and p_chord_set are the sets themselves. Checkbox n shows pitch
+# class 11 - n, and the chord selectboxes show the chord relative to
+# p_chord_root_index.
+
+## Chord
+
+def relative_chord(state: MutableMapping) -> int:
+    return int(state["p_chord_set"].normalize(state["p_chord_root_index"]))
+
+def sync_chord_checkboxes(state: MutableMapping):
+    for x in range(12):
+        state["chord_checkbox_"+str(x)] = 11 - x in state["p_chord_set"]
+
+def sync_chord_decimal(state: MutableMapping):
+    state["chord_decimal"] = relative_chord(state)
+
+def sync_chord_selectboxes(state: MutableMapping):
+    for generic_interval, selected in zip(chord_tables.GENERIC_INTERVALS, chord_tables.states(relative_chord(state))):
+        state[generic_interval] = selected
+
+def ensure_valid_chord_root(state: MutableMapping):
+    chord_root_index = state["p_chord_root_index"]
+    if chord_root_index == -1 or chord_root_index not in state["p_chord_set"]:
+        state["p_chord_root_index"] = state["p_chord_set"].lowest()
+
+def sync_chord_to_scale(state: MutableMapping):
+    state["p_chord_set"] = state["p_chord_set"].mask(state["p_scale_set"])
+    ensure_valid_chord_root(state)
+
+def update_chord_by_checkbox(state: MutableMapping):
+    state["p_chord_set"] = PitchClassSet.from_pitch_classes(
+        11 - x for x in range(12) if state["chord_checkbox_"+str(x)]
+    )
+    ensure_valid_chord_root(state)
+    sync_chord_decimal(state)
+    sync_chord_selectboxes(state)
+
+def update_chord_by_root(state: MutableMapping):
+    sync_chord_decimal(state)
+    sync_chord_selectboxes(state)
+
+def update_chord_by_selectbox(state: MutableMapping):
+    chord = chord_tables.chord(tuple(state[generic_interval] for generic_interval in chord_tables.GENERIC_INTERVALS))
+    state["p_chord_set"] = PitchClassSet(chord).transpose(state["p_chord_root_index"])
+    sync_chord_checkboxes(state)
+    sync_chord_decimal(state)
+    sync_chord_selectboxes(state)
+
+## Scale
+
+def sync_scale_checkboxes(state: MutableMapping):
+    for x in range(12):
+        state["scale_checkbox_"+str(x)] = 11 - x in state["p_scale_set"]
+
+def sync_scale_root(state: MutableMapping):
+    state["scale_root"] = PITCHNAMES[state["p_scale_root_index"]]
+
+def sync_scale_decimal(state: MutableMapping):
+    state["scale_decimal"] = int(state["p_scale_set"])
+
+def update_scale_by_checkbox(state: MutableMapping):
+    state["p_scale_set"] = PitchClassSet.from_pitch_classes(
+        11 - x for x in range(12) if state["scale_checkbox_"+str(x)]
+    )
+    sync_scale_decimal(state)
+    sync_chord_to_scale(state)
+
+def update_scale_by_root(state: MutableMapping):
+    state["p_scale_root_index"] = PITCHNAMES.index(state["scale_root"])
+
+def update_scale_by_decimal(state: MutableMapping):
+    if state["scale_decimal"] % 2 == 0:
+        state["scale_decimal"] += 1
+
+    state["p_scale_set"] = PitchClassSet(state["scale_decimal"])
+    sync_scale_checkboxes(state)
+    sync_chord_to_scale(state)
+
+def sync_widgets(state: MutableMapping):
+    # Done at the end of every rerun's synchronization
+    sync_scale_checkboxes(state)
+    sync_scale_root(state)
+    sync_scale_decimal(state)
+
+    sync_chord_checkboxes(state)
+    sync_chord_selectboxes(state)
+
+## Manipulation
+
+def rotate_chord_left(state: MutableMapping):
+    state["p_chord_root_index"] = state["p_chord_set"].next_below(state["p_chord_root_index"])
+    sync_chord_decimal(state)
+    sync_chord_selectboxes(state)
+
+def rotate_chord_right(state: MutableMapping):
+    if len(state["p_chord_set"]) <= 1:
+        return
+    state["p_chord_root_index"] = state["p_chord_set"].next_above(state["p_chord_root_index"])
+    sync_chord_decimal(state)
+    sync_chord_selectboxes(state)
+
+def rotate_scale_left(state: MutableMapping):
+    state["p_scale_set"] = state["p_scale_set"].rotate_up()
+    sync_scale_checkboxes(state)
+    sync_scale_decimal(state)
+    sync_chord_to_scale(state)
+
+def rotate_scale_right(state: MutableMapping):
+    state["p_scale_set"] = state["p_scale_set"].rotate_down()
+    sync_scale_checkboxes(state)
+    sync_scale_decimal(state)
+    sync_chord_to_scale(state)
@@ -0,0 +1,418 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import math
+import multiprocessing
+import os
+import queue as queues
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Callable
+from urllib.parse import parse_qs, urlparse
+
+import lib.chord_index as chord_index
+import lib.expression_bank as expression_bank
+import lib.melody as melody
+import lib.modes as modes
+import lib.playback as playback
+import lib.scale_catalog as scale_catalog
+import lib.scale_similarity as scale_similarity
+from lib.constants import PITCHNAMES
+from lib.pitchclassset import PitchClassSet
+
+# A local HTTP service for other tools:
+#
+#   POST /generate                      settings JSON -> audio/midi
+#   GET  /names/<decimal>               name of a scale or chord
+#   GET  /names?search=<text>[&prefix=1][&limit=N]
+#   GET  /chords?scale=<decimal>&root=<pitch class>
+#   GET  /scales/similar?decimal=<decimal>[&limit=N]
+#   GET  /pitch-class-sets/rotate?decimal=<decimal>&direction=up|down[&steps=N]
+#   GET  /pitch-class-sets/mask?decimal=<decimal>&mask=<decimal>
+#
+# Connections are handled by a bounded thread pool, and a request that finds
+# every thread and queue slot taken gets 503. Generation runs in a fixed set
+# of worker processes. Each request has a timeout: the caller gets 504 when it
+# passes. Generation normally stops at its time limit, but a single
+# evaluation that blocks (e.g. 10**10**8) can't be interrupted, so a worker
+# still busy at the timeout is terminated and replaced.
+#
+# Only programs on this machine may use the service. Any web page could send
+# requests to it from a browser, so requests naming another host or coming
+# from another origin are refused, and generation takes JSON only, which a
+# page can't post to another origin without the browser asking first. The
+# expressions are evaluated with restricted builtins (see expression_bank).
+
+DEFAULT_THREADS = 8
+DEFAULT_QUEUE = 16
+DEFAULT_TIMEOUT = 10.0
+MAX_BODY_SIZE = 1 << 20
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+class ServiceError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        self.status = status
+        super().__init__(message)
+
+def _generate(settings: dict, limits: melody.Limits, deadline: float) -> tuple[bytes, dict]:
+    # Runs in a worker process. A job that waited in the queue only gets the
+    # time its request has left.
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise TimeoutError("Generation did not start before the request timed out")
+    if limits.seconds is None or limits.seconds > remaining:
+        limits = limits._replace(seconds=remaining)
+    report = melody.GenerationReport()
+    mf = melody.generate(settings, limits, report, bank=expression_bank.ExpressionBank(expression_bank.SAFE_BUILTINS))
+    return playback.midi_to_bytes(mf), {"notes": report.notes, "limit": report.limit, "x": report.x}
+
+def _integer(query: dict, name: str, default: int | None = None, minimum: int | None = None) -> int:
+    values = query.get(name)
+    if not values:
+        if default is None:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "Missing parameter: {}".format(name))
+        return default
+    try:
+        value = int(values[0])
+    except ValueError:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "Parameter {} must be an integer".format(name))
+    if minimum is not None and value < minimum:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "Parameter {} must be at least {}".format(name, minimum))
+    return value
+
+def _hostname(url: str) -> str | None:
+    try:
+        return urlparse(url).hostname
+    except ValueError:
+        return None
+
+def _pitch_class_set(query: dict, name: str) -> PitchClassSet:
+    try:
+        return PitchClassSet(_integer(query, name))
+    except ValueError as e:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, str(e))
+
+def _describe(pitch_class_set: PitchClassSet) -> dict:
+    return {
+        "decimal": int(pitch_class_set),
+        "binary": pitch_class_set.binary(),
+        "pitch_classes": list(pitch_class_set),
+    }
+
+def _number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def validate_settings(settings) -> dict:
+    # Catches malformed settings before they reach a worker, so anything
+    # failing there is a server error rather than a bad request
+    def invalid(message: str):
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "Invalid settings: {}".format(message))
+
+    if not isinstance(settings, dict):
+        invalid("expected an object")
+
+    time_signature = settings.get("time_signature")
+    if not isinstance(time_signature, dict):
+        invalid("time_signature must be an object")
+    numerator = time_signature.get("numerator")
+    denominator = time_signature.get("denominator")
+    if not isinstance(numerator, int) or isinstance(numerator, bool) or not 1 <= numerator <= 255:
+        invalid("time_signature.numerator must be an integer from 1 to 255")
+    if not isinstance(denominator, int) or isinstance(denominator, bool) or denominator not in [2 ** n for n in range(8)]:
+        invalid("time_signature.denominator must be a power of two up to 128")
+
+    if not _number(settings.get("tempo")) or not 0 < settings["tempo"] <= 1000:
+        invalid("tempo must be a number above 0 and at most 1000")
+    if not _number(settings.get("length")) or settings["length"] < 0:
+        invalid("length must be a number of beats")
+
+    scale = settings.get("scale")
+    root, _, decimal = scale.partition("-") if isinstance(scale, str) else ("", "", "")
+    if root not in PITCHNAMES or not decimal.isdigit() or not 0 < int(decimal) <= 4095:
+        invalid("scale must look like C-2741")
+
+    expressions = settings.get("expressions")
+    if not isinstance(expressions, list) or len(expressions) > 26 or not all(isinstance(e, str) for e in expressions):
+        invalid("expressions must be a list of at most 26 strings")
+
+    voices = settings.get("voices", [])
+    if not isinstance(voices, list) or not all(isinstance(voice, dict) for voice in voices):
+        invalid("voices must be a list of objects")
+    for number, voice in enumerate([settings] + voices, 1):
+        for field in melody.FIELDS:
+            if not isinstance(voice.get(field), str):
+                invalid("{} of voice {} must be a string".format(field, number))
+
+    return settings
+
+# Lookups, answered on the connection's thread
+
+def name(decimal: int) -> dict:
+    if not 0 <= decimal <= 4095:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "Decimal must be between 0 and 4095")
+    return {"decimal": decimal, "name": scale_catalog.name(decimal)}
+
+def search(query: dict) -> list[dict]:
+    text = query.get("search", [""])[0]
+    prefix = query.get("prefix", ["0"])[0].lower() in ("1", "true", "yes")
+    limit = _integer(query, "limit", 100, minimum=0)
+    return [{"decimal": decimal, "name": scale_name} for decimal, scale_name in scale_catalog.search(text, prefix, limit)]
+
+def chords(query: dict) -> list[dict]:
+    try:
+        entries = chord_index.chords_at_root(_integer(query, "scale"), _integer(query, "root", 0) % 12)
+    except ValueError as e:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, str(e))
+    return [{"decimal": entry.decimal, "name": entry.name} for entry in entries]
+
+def similar(query: dict) -> list[dict]:
+    return [
+        neighbour._asdict()
+        for neighbour in scale_similarity.nearest(int(_pitch_class_set(query, "decimal")), _integer(query, "limit", 10, minimum=0))
+    ]
+
+def rotate(query: dict) -> dict:
+    pitch_class_set = _pitch_class_set(query, "decimal")
+    direction = query.get("direction", ["up"])[0]
+    if direction not in ("up", "down"):
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "Direction must be up or down")
+    steps = _integer(query, "steps", 1)
+    if direction == "down":
+        steps = -steps
+    if steps == 0 or len(pitch_class_set) <= 1:
+        return _describe(pitch_class_set)
+    if modes.mode_index(int(pitch_class_set)) == -1:
+        # A set without its root isn't one of the modes yet. The first step
+        # makes it one.
+        pitch_class_set = pitch_class_set.rotate_up() if steps > 0 else pitch_class_set.rotate_down()
+        steps -= 1 if steps > 0 else -1
+    bits = int(pitch_class_set)
+    return _describe(PitchClassSet(modes.mode(bits, modes.mode_index(bits) + steps)))
+
+def mask(query: dict) -> dict:
+    return _describe(_pitch_class_set(query, "decimal").mask(_pitch_class_set(query, "mask")))
+
+# HTTP
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "Service"
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # Also bounds how long a slow client can hold a thread
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: HTTPStatus, body: bytes, content_type: str, headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: HTTPStatus, value, headers: dict | None = None):
+        self._send(status, json.dumps(value, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8", headers)
+
+    def _check_origin(self):
+        # A page that rebinds its own host name to this machine sends that
+        # name in Host
+        if _hostname("//" + (self.headers.get("Host") or "")) not in LOCAL_HOSTS:
+            raise ServiceError(HTTPStatus.FORBIDDEN, "Host must be localhost or 127.0.0.1")
+        origin = self.headers.get("Origin")
+        if origin is not None and _hostname(origin) not in LOCAL_HOSTS:
+            raise ServiceError(HTTPStatus.FORBIDDEN, "Requests from other origins are not allowed")
+
+    def _handle(self, route):
+        try:
+            self._check_origin()
+            route()
+        # A request refused early may leave its body unread, so the
+        # connection isn't reused after an error
+        except ServiceError as e:
+            self._send_json(e.status, {"error": str(e)}, {"Connection": "close"})
+        except Exception as e:
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}, {"Connection": "close"})
+
+    def do_GET(self):
+        self._handle(self._get)
+
+    def do_POST(self):
+        self._handle(self._post)
+
+    def _get(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+
+        if parts[0] == "names" and len(parts) == 2:
+            try:
+                decimal = int(parts[1])
+            except ValueError:
+                raise ServiceError(HTTPStatus.BAD_REQUEST, "Expected a decimal")
+            self._send_json(HTTPStatus.OK, name(decimal))
+        elif parts == ["names"]:
+            self._send_json(HTTPStatus.OK, search(query))
+        elif parts == ["chords"]:
+            self._send_json(HTTPStatus.OK, chords(query))
+        elif parts == ["scales", "similar"]:
+            self._send_json(HTTPStatus.OK, similar(query))
+        elif parts == ["pitch-class-sets", "rotate"]:
+            self._send_json(HTTPStatus.OK, rotate(query))
+        elif parts == ["pitch-class-sets", "mask"]:
+            self._send_json(HTTPStatus.OK, mask(query))
+        else:
+            raise ServiceError(HTTPStatus.NOT_FOUND, "Not found: {}".format(url.path))
+
+    def _post(self):
+        if urlparse(self.path).path.rstrip("/") != "/generate":
+            raise ServiceError(HTTPStatus.NOT_FOUND, "Not found: {}".format(self.path))
+
+        content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            raise ServiceError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "Content-Type must be application/json")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "Content-Length must be an integer")
+        if length < 0:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "Content-Length must not be negative")
+        if length > MAX_BODY_SIZE:
+            raise ServiceError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Settings are too large")
+        try:
+            settings = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "Expected settings JSON")
+        data, report = self.server.generate(validate_settings(settings))
+        headers = {"X-Generation-Notes": str(report["notes"])}
+        if report["limit"] is not None:
+            headers["X-Generation-Limit"] = report["limit"]
+        self._send(HTTPStatus.OK, data, "audio/midi", headers)
+
+class _Workers:
+    # Generation processes, one pool of one process each, so a job still
+    # running at its timeout can be killed without affecting the others.
+    #
+    # Replacements are started from handler threads while other threads run,
+    # so processes are never forked from this process: a fork could copy a
+    # lock another thread holds. They come from a single-threaded fork server
+    # instead, which has the generation code imported already, or are spawned
+    # where there is none.
+
+    def __init__(self, size: int):
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context("forkserver")
+            self._context.set_forkserver_preload([__name__])
+        else:
+            self._context = multiprocessing.get_context("spawn")
+        self._idle = queues.Queue()
+        for _ in range(size):
+            self._idle.put(self._context.Pool(1))
+
+    def run(self, function: Callable, args: tuple, timeout: float):
+        deadline = time.monotonic() + timeout
+        try:
+            pool = self._idle.get(timeout=timeout)
+        except queues.Empty:
+            raise TimeoutError
+        try:
+            return pool.apply_async(function, args).get(max(0.0, deadline - time.monotonic()))
+        except multiprocessing.TimeoutError:
+            pool.terminate()
+            pool = self._context.Pool(1)
+            raise TimeoutError
+        finally:
+            self._idle.put(pool)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().terminate()
+            except queues.Empty:
+                return
+
+class Service(HTTPServer):
+    def __init__(
+        self,
+        address: tuple[str, int],
+        threads: int = DEFAULT_THREADS,
+        workers: int | None = None,
+        queue: int = DEFAULT_QUEUE,
+        request_timeout: float = DEFAULT_TIMEOUT,
+        verbose: bool = False,
+    ):
+        super().__init__(address, _Handler)
+        self.request_timeout = request_timeout
+        self.verbose = verbose
+        self.threads = ThreadPoolExecutor(threads, thread_name_prefix="service")
+        self.workers = _Workers(workers or os.cpu_count() or 1)
+        self.slots = threading.BoundedSemaphore(threads + queue)
+        scale_catalog.load()
+        scale_similarity.build()
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            try:
+                request.sendall(
+                    b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+                )
+            finally:
+                self.shutdown_request(request)
+            return
+        self.threads.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def generate(self, settings: dict) -> tuple[bytes, dict]:
+        # Anything else a worker raises is a server error
+        try:
+            # The time limit stops generation from inside; the extra second
+            # covers writing the MIDI and sending it back
+            return self.workers.run(
+                _generate,
+                (settings, melody.DEFAULT_LIMITS, time.time() + self.request_timeout),
+                self.request_timeout + 1.0,
+            )
+        except TimeoutError:
+            raise ServiceError(
+                HTTPStatus.GATEWAY_TIMEOUT,
+                "Generation did not finish within {} seconds".format(self.request_timeout),
+            )
+        except melody.GenerationError as e:
+            raise ServiceError(HTTPStatus.UNPROCESSABLE_ENTITY, str(e))
+
+    def server_close(self):
+        super().server_close()
+        self.threads.shutdown(wait=False, cancel_futures=True)
+        self.workers.close()
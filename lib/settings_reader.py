@@ -0,0 +1,78 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import struct
+from typing import BinaryIO
+
+# Reads the settings text event that the Melody Creator embeds at the start
+# of the second track, seeking past the first track instead of decoding the
+# whole file. Files laid out differently fall back to a full mido parse.
+
+class SettingsNotFound(Exception):
+    pass
+
+def _read_exactly(file: BinaryIO, size: int) -> bytes:
+    data = file.read(size)
+    if len(data) != size:
+        raise SettingsNotFound("Unexpected end of file")
+    return data
+
+def _read_variable_length(file: BinaryIO) -> int:
+    value = 0
+    for _ in range(4):
+        byte = _read_exactly(file, 1)[0]
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value
+    raise SettingsNotFound("Invalid variable-length quantity")
+
+def _chunk_header(file: BinaryIO) -> tuple[bytes, int]:
+    kind, length = struct.unpack(">4sI", _read_exactly(file, 8))
+    return kind, length
+
+def read_settings_text(file: BinaryIO) -> str:
+    kind, length = _chunk_header(file)
+    if kind != b"MThd":
+        raise SettingsNotFound("Not a MIDI file")
+    _, tracks, _ = struct.unpack(">HHH", _read_exactly(file, 6))
+    file.seek(length - 6, 1)
+    if tracks < 2:
+        raise SettingsNotFound("The file has no settings track")
+
+    # Skip the conductor track, then expect a text event at the start of the
+    # settings track
+    kind, length = _chunk_header(file)
+    file.seek(length, 1)
+    kind, length = _chunk_header(file)
+    if kind != b"MTrk":
+        raise SettingsNotFound("Missing settings track")
+    _read_variable_length(file)
+    if _read_exactly(file, 2) != b"\xff\x01":
+        raise SettingsNotFound("The settings track doesn't start with a text event")
+    size = _read_variable_length(file)
+    return _read_exactly(file, size).decode("latin-1")
+
+def read_settings(path: str) -> dict:
+    try:
+        with open(path, "rb") as file:
+            return json.loads(read_settings_text(file))
+    except SettingsNotFound:
+        import mido
+        midi = mido.MidiFile(path)
+        return json.loads(midi.tracks[1][0].text)
@@ -45,4 +45,21 @@ def show_sidebar():
         columns[0].button(
                 "Buy Me a Coffee ☕",
                 on_click=lambda: webbrowser.open("https://www.buymeacoffee.com/davidrudpedersen")
-        )
\ No newline at end of file
+        )
+
+
+def show_timings(record: dict):
+    if "p_show_timings" not in st.session_state:
+        st.session_state["p_show_timings"] = False
+    with st.sidebar:
+        st.divider()
+        st.checkbox("Show Timings", key="p_show_timings", help="Time spent in each stage of the last rerun.")
+        if st.session_state["p_show_timings"]:
+            st.dataframe(
+                [
+                    {"Stage": name, "Time (ms)": round(seconds * 1000, 2)}
+                    for name, seconds in record["stages"].items()
+                ] + [{"Stage": "Total", "Time (ms)": round(record["total"] * 1000, 2)}],
+                hide_index=True,
+                use_container_width=True,
+            )
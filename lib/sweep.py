@@ -0,0 +1,164 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import copy
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import lib.melody as melody
+import lib.modes as modes
+import lib.playback as playback
+
+# A sweep generates every combination of a set of parameter grids applied to
+# one base setup. Grid keys are settings fields ("initial_x", "tempo",
+# "scale", "pitch", ...), "numerator"/"denominator" for the time signature,
+# or a letter A-Z for a stored expression. Values are either a list, a range
+# {"range": [start, stop, step]} (stop excluded), or "modes" for every mode
+# of the base scale.
+#
+# Results go to a directory of MIDI files, or to the tracks of one MIDI file,
+# together with manifest.json mapping every output to its parameters.
+
+EXPRESSION_FIELDS = {"initial_x", "new_x", "pitch", "duration", "rest", "velocity"}
+
+MANIFEST_NAME = "manifest.json"
+
+class SweepError(Exception):
+    pass
+
+def scale_modes(scale: str) -> list[str]:
+    root, decimal = scale.split("-", 1)
+    return ["{}-{}".format(root, mode) for mode in modes.modes(int(decimal))]
+
+def _values(base: dict, key: str, grid) -> list:
+    if grid == "modes":
+        if key != "scale":
+            raise SweepError("Only the scale can be swept over its modes")
+        return scale_modes(base["scale"])
+    if isinstance(grid, dict) and "range" in grid:
+        start, stop, step = grid["range"]
+        if step == 0:
+            raise SweepError("The step of {} can't be 0".format(key))
+        count = max(0, int(-(-(stop - start) // step)))
+        values = [start + step * i for i in range(count)]
+    elif isinstance(grid, list):
+        values = grid
+    else:
+        raise SweepError('Grid for {} must be a list, a range or "modes"'.format(key))
+    if key in EXPRESSION_FIELDS or _is_letter(key):
+        values = [value if isinstance(value, str) else repr(value) for value in values]
+    return values
+
+def _is_letter(key: str) -> bool:
+    return len(key) == 1 and "A" <= key <= "Z"
+
+def apply(base: dict, parameters: dict) -> dict:
+    settings = copy.deepcopy(base)
+    for key, value in parameters.items():
+        if key in ("numerator", "denominator"):
+            settings["time_signature"][key] = value
+        elif _is_letter(key):
+            index = ord(key) - ord("A")
+            if index >= len(settings["expressions"]):
+                raise SweepError("Expression {} is not defined in the base settings".format(key))
+            settings["expressions"][index] = value
+        elif key in settings:
+            settings[key] = value
+        else:
+            raise SweepError("Unknown sweep parameter {}".format(key))
+    return settings
+
+def expand(base: dict, grids: dict) -> list[dict]:
+    keys = list(grids)
+    axes = [_values(base, key, grids[key]) for key in keys]
+    return [dict(zip(keys, combination)) for combination in itertools.product(*axes)]
+
+def _render_file(base: dict, parameters: dict, path: str, limits: melody.Limits) -> str:
+    playback.save_midi(melody.generate(apply(base, parameters), limits), path)
+    return path
+
+def _render_notes(base: dict, parameters: dict, limits: melody.Limits) -> list[melody.Note]:
+    return list(melody.generate_notes(apply(base, parameters), limits))
+
+def run(
+    base: dict,
+    grids: dict,
+    output_dir: str,
+    workers: int | None = None,
+    single_file: bool = False,
+    limits: melody.Limits = melody.DEFAULT_LIMITS,
+) -> dict:
+    if single_file and grids.keys() & {"tempo", "numerator", "denominator"}:
+        raise SweepError("Tempo and time signature can't vary within a single MIDI file")
+
+    variants = expand(base, grids)
+    os.makedirs(output_dir, exist_ok=True)
+
+    width = len(str(len(variants)))
+    entries = []
+    failures = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if single_file:
+            futures = [executor.submit(_render_notes, base, parameters, limits) for parameters in variants]
+        else:
+            futures = [
+                executor.submit(
+                    _render_file,
+                    base,
+                    parameters,
+                    os.path.join(output_dir, "variant_{}.mid".format(str(i).zfill(width))),
+                    limits,
+                )
+                for i, parameters in enumerate(variants)
+            ]
+
+        results = []
+        for parameters, future in zip(variants, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(None)
+                failures.append({"parameters": parameters, "error": str(e)})
+
+    if single_file:
+        tracks = [notes for notes in results if notes is not None]
+        mf = melody.create_midi(base, max(1, len(tracks)))
+        track = 0
+        for parameters, notes in zip(variants, results):
+            if notes is None:
+                continue
+            mf.addTrackName(track, 0, json.dumps(parameters))
+            for note in notes:
+                mf.addNote(track, 0, note.pitch, note.time, note.duration, note.velocity)
+            entries.append({"track": track, "parameters": parameters})
+            track += 1
+        playback.save_midi(mf, os.path.join(output_dir, "sweep.mid"))
+        manifest = {"base": base, "file": "sweep.mid", "tracks": entries, "failures": failures}
+    else:
+        for parameters, path in zip(variants, results):
+            if path is not None:
+                entries.append({"file": os.path.basename(path), "parameters": parameters})
+        manifest = {"base": base, "files": entries, "failures": failures}
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+
+    return manifest
@@ -0,0 +1,144 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import io
+import threading
+import wave
+import weakref
+from collections import namedtuple
+
+import numpy as np
+from midiutil import MIDIFile
+
+import lib.playback as playback
+
+# A small additive synthesizer for rendering MIDI to PCM without an audio
+# device or a system MIDI synth. Each note is a few harmonics under an ADSR
+# envelope, computed as NumPy arrays and mixed into one buffer.
+
+SAMPLE_RATE = 44100
+
+HARMONICS = (1.0, 0.5, 0.25, 0.125)
+
+ATTACK = 0.01
+DECAY = 0.1
+SUSTAIN = 0.7
+RELEASE = 0.15
+
+Note = namedtuple("Note", ["start", "duration", "pitch", "velocity"])
+
+_rendered = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+def notes_from_midi_bytes(data: bytes) -> list[Note]:
+    # Times are in seconds, with tempo changes already applied by mido
+    import mido
+    notes = []
+    active = {}
+    time = 0.0
+    for message in mido.MidiFile(file=io.BytesIO(data)):
+        time += message.time
+        if message.type == "note_on" and message.velocity > 0:
+            active.setdefault((message.channel, message.note), []).append((time, message.velocity))
+        elif message.type in ("note_on", "note_off"):
+            started = active.get((message.channel, message.note))
+            if started:
+                start, velocity = started.pop(0)
+                notes.append(Note(start, time - start, message.note, velocity))
+    return sorted(notes)
+
+def notes_from_midi(mf: MIDIFile) -> list[Note]:
+    return notes_from_midi_bytes(playback.midi_to_bytes(mf))
+
+def _envelope(length: int, held: int, sample_rate: int) -> np.ndarray:
+    t = np.arange(length) / sample_rate
+    attack = np.minimum(t / ATTACK, 1.0)
+    decay = np.clip(1.0 - (t - ATTACK) / DECAY * (1.0 - SUSTAIN), SUSTAIN, 1.0)
+    envelope = attack * decay
+    if held < length:
+        release_start = envelope[held - 1] if held > 0 else 0.0
+        envelope[held:] = release_start * np.maximum(1.0 - (t[held:] - t[held]) / RELEASE, 0.0)
+    return envelope
+
+def render(notes: list[Note], sample_rate: int = SAMPLE_RATE, seconds: float | None = None) -> np.ndarray:
+    # With seconds, only that much of the melody is rendered, so the buffer
+    # doesn't grow with the length of the melody
+    if seconds is not None:
+        notes = [
+            note._replace(duration=min(note.duration, seconds - note.start))
+            for note in notes
+            if note.start < seconds
+        ]
+    if not notes:
+        return np.zeros(0, dtype=np.float32)
+
+    end = max(note.start + note.duration for note in notes) + RELEASE
+    output = np.zeros(int(np.ceil(end * sample_rate)) + 1, dtype=np.float64)
+
+    # Envelopes and phases only depend on the note length, so notes of equal
+    # length share them
+    envelopes = {}
+    phases = {}
+
+    for note in notes:
+        held = max(1, int(round(note.duration * sample_rate)))
+        length = held + int(RELEASE * sample_rate)
+        start = int(round(note.start * sample_rate))
+        length = min(length, len(output) - start)
+        if length <= 0:
+            continue
+
+        if (length, held) not in envelopes:
+            envelopes[(length, held)] = _envelope(length, held, sample_rate)
+        if length not in phases:
+            phases[length] = 2 * np.pi * np.arange(length) / sample_rate
+
+        frequency = 440.0 * 2 ** ((note.pitch - 69) / 12)
+        phase = phases[length] * frequency
+        tone = np.zeros(length)
+        for number, amplitude in enumerate(HARMONICS, start=1):
+            if frequency * number < sample_rate / 2:
+                tone += amplitude * np.sin(phase * number)
+
+        output[start:start + length] += tone * envelopes[(length, held)] * (note.velocity / 127)
+
+    peak = np.max(np.abs(output))
+    if peak > 0:
+        output *= 0.9 / max(peak, 1.0)
+    return output.astype(np.float32)
+
+def to_wav_bytes(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> bytes:
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(sample_rate)
+        file.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+def render_midi(mf: MIDIFile, sample_rate: int = SAMPLE_RATE, seconds: float | None = None) -> bytes:
+    with _lock:
+        renders = _rendered.setdefault(mf, {})
+        if (sample_rate, seconds) not in renders:
+            renders[sample_rate, seconds] = to_wav_bytes(render(notes_from_midi(mf), sample_rate, seconds), sample_rate)
+        return renders[sample_rate, seconds]
+
+def write_wav(mf: MIDIFile, path: str, sample_rate: int = SAMPLE_RATE):
+    with open(path, "wb") as f:
+        f.write(render_midi(mf, sample_rate))
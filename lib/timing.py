@@ -0,0 +1,151 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+# Times the stages of a page rerun. The breakdown can be shown in the sidebar
+# and is exported, when the environment asks for it, as JSON lines
+# (MUSICTOOLS_METRICS_JSONL) and/or a Prometheus text file
+# (MUSICTOOLS_METRICS_PROM) with counters summed over every session served
+# by the process.
+
+JSONL_ENV = "MUSICTOOLS_METRICS_JSONL"
+PROMETHEUS_ENV = "MUSICTOOLS_METRICS_PROM"
+
+_lock = threading.Lock()
+_stage_seconds = {}
+_stage_count = {}
+_reruns = {}
+_rerun_seconds = {}
+
+class Rerun:
+    def __init__(self, page: str, session: str | None = None):
+        self.page = page
+        self.session = session
+        self.stages = {}
+        self.started = self.last = time.perf_counter()
+        self.finished = False
+        self.script = False
+
+    def _add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.last = time.perf_counter()
+            self._add(name, self.last - started)
+
+    def lap(self, name: str):
+        # Attributes the time since the previous stage or lap to name
+        now = time.perf_counter()
+        self._add(name, now - self.last)
+        self.last = now
+
+    def finish(self) -> dict:
+        self.finished = True
+        record = {
+            "time": time.time(),
+            "page": self.page,
+            "session": self.session,
+            "total": time.perf_counter() - self.started,
+            "stages": dict(self.stages),
+        }
+        export(record)
+        return record
+
+def start(state: MutableMapping, page: str, script: bool = False) -> Rerun:
+    # Callbacks run before the page script, so their stages are counted in the
+    # rerun the script then picks up. A rerun the script already started but
+    # never finished was interrupted and is dropped.
+    if "timing_session" not in state:
+        state["timing_session"] = uuid.uuid4().hex
+    rerun = state.get("timing_rerun")
+    if rerun is None or rerun.finished or rerun.script or rerun.page != page:
+        rerun = state["timing_rerun"] = Rerun(page, state["timing_session"])
+    rerun.script = script
+    return rerun
+
+def export(record: dict):
+    jsonl_path = os.environ.get(JSONL_ENV)
+    prometheus_path = os.environ.get(PROMETHEUS_ENV)
+    with _lock:
+        page = record["page"]
+        _reruns[page] = _reruns.get(page, 0) + 1
+        _rerun_seconds[page] = _rerun_seconds.get(page, 0.0) + record["total"]
+        for name, seconds in record["stages"].items():
+            key = (page, name)
+            _stage_seconds[key] = _stage_seconds.get(key, 0.0) + seconds
+            _stage_count[key] = _stage_count.get(key, 0) + 1
+
+        if jsonl_path:
+            with open(jsonl_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        if prometheus_path:
+            _write_prometheus(prometheus_path)
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus_text() -> str:
+    lines = [
+        "# HELP musictools_reruns_total Page reruns.",
+        "# TYPE musictools_reruns_total counter",
+    ]
+    lines += ['musictools_reruns_total{{page="{}"}} {}'.format(_label(page), count) for page, count in _reruns.items()]
+    lines += [
+        "# HELP musictools_rerun_seconds_total Time spent in page reruns.",
+        "# TYPE musictools_rerun_seconds_total counter",
+    ]
+    lines += [
+        'musictools_rerun_seconds_total{{page="{}"}} {!r}'.format(_label(page), seconds)
+        for page, seconds in _rerun_seconds.items()
+    ]
+    lines += [
+        "# HELP musictools_stage_seconds_total Time spent in each stage of a page rerun.",
+        "# TYPE musictools_stage_seconds_total counter",
+    ]
+    lines += [
+        'musictools_stage_seconds_total{{page="{}",stage="{}"}} {!r}'.format(_label(page), _label(name), seconds)
+        for (page, name), seconds in _stage_seconds.items()
+    ]
+    lines += [
+        "# HELP musictools_stage_runs_total Reruns in which each stage ran.",
+        "# TYPE musictools_stage_runs_total counter",
+    ]
+    lines += [
+        'musictools_stage_runs_total{{page="{}",stage="{}"}} {}'.format(_label(page), _label(name), count)
+        for (page, name), count in _stage_count.items()
+    ]
+    return "\n".join(lines) + "\n"
+
+def _write_prometheus(path: str):
+    # Replaced atomically so a scraper never reads half a file
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as f:
+        f.write(prometheus_text())
+    os.replace(temporary_path, path)
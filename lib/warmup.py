@@ -0,0 +1,49 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+
+# Builds the lookup tables the pages need on their first rerun (the scale
+# catalog, the chord index, the mode families and the similarity features)
+# on a background thread, once per process, so the first session doesn't
+# wait for them.
+
+_lock = threading.Lock()
+_thread = None
+
+def _warm():
+    import lib.chord_index as chord_index
+    import lib.modes as modes
+    import lib.scale_catalog as scale_catalog
+    import lib.scale_similarity as scale_similarity
+
+    scale_catalog.load()
+    chord_index.build()
+    modes.named_modes(2741)
+    scale_similarity.build()
+
+def start() -> threading.Thread:
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_warm, name="warmup", daemon=True)
+            _thread.start()
+        return _thread
+
+def wait(timeout: float | None = None):
+    start().join(timeout)
@@ -0,0 +1,82 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+# Index and search a directory of melodies saved by Melody Creator.
+#
+#   python library.py index melodies/
+#   python library.py query --scale C-2741 --min-tempo 60 --expression "sin("
+
+import argparse
+import json
+import sys
+
+from lib.melody_library import MelodyLibrary
+
+DEFAULT_DATABASE = "melodies.db"
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Index and search saved melodies.")
+    parser.add_argument("--database", default=DEFAULT_DATABASE, help="SQLite index file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser("index", help="add new and changed melodies in a directory to the index")
+    index_parser.add_argument("directory")
+
+    query_parser = subparsers.add_parser("query", help="list indexed melodies matching every given filter")
+    query_parser.add_argument("--scale", help="exact scale, e.g. C-2741")
+    query_parser.add_argument("--scale-decimal", type=int, help="scale decimal in any root")
+    query_parser.add_argument("--root", help="scale root, e.g. C")
+    query_parser.add_argument("--min-tempo", type=float)
+    query_parser.add_argument("--max-tempo", type=float)
+    query_parser.add_argument("--min-length", type=float)
+    query_parser.add_argument("--max-length", type=float)
+    query_parser.add_argument("--expression", help="text contained in any expression")
+    query_parser.add_argument("--limit", type=int)
+    query_parser.add_argument("--json", action="store_true", help="print the full settings of each match")
+
+    args = parser.parse_args(argv)
+
+    with MelodyLibrary(args.database) as library:
+        if args.command == "index":
+            result = library.update(args.directory)
+            print(
+                "{} added, {} updated, {} removed, {} unchanged".format(
+                    result.added, result.updated, result.removed, result.unchanged
+                )
+            )
+            return 0
+
+        melodies = library.query(
+            scale=args.scale,
+            scale_decimal=args.scale_decimal,
+            root=args.root,
+            min_tempo=args.min_tempo,
+            max_tempo=args.max_tempo,
+            min_length=args.min_length,
+            max_length=args.max_length,
+            expression=args.expression,
+            limit=args.limit,
+        )
+        for m in melodies:
+            if args.json:
+                print(json.dumps({"path": m.path, "settings": m.settings}))
+            else:
+                print("{}\t{}\t{} bpm\t{} beats".format(m.path, m.scale, m.tempo, m.length))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
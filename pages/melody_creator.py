@@ -17,27 +17,28 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import json
-import math
 import os
 
-import mido
-import numpy as np
-import plotly.graph_objects as go
-import pygame.mixer
 import pyperclip
 import streamlit as st
-from filedialogs import open_file_dialog, save_file_dialog
-from midiutil import MIDIFile
-from plotly.subplots import make_subplots
 
 import lib.expression_bank as expression_bank
-from lib.constants import PITCHNAMES
-from lib.sidebar import show_sidebar
+import lib.melody as melody
+import lib.playback as playback
+import lib.timing as timing
+import lib.warmup as warmup
+from lib.sidebar import show_sidebar, show_timings
 from lib.style import style
 
+timings = timing.start(st.session_state, "melody_creator", script=True)
+
+warmup.start()
+
 show_sidebar()
 style()
 
+timings.lap("sidebar")
+
 # Auto copy 𝑥 to the clipboard
 
 if pyperclip.paste() != "\U0001d465":
@@ -57,7 +58,14 @@ variables = {
     "p_length": 16,
     "p_scale": "C-2741",
     "p_expression_count": 0,
+    "p_voice_count": 1,
     "p_show_plot": False,
+    "p_plot_start": 0.0,
+    "p_plot_stop": 10.0,
+    "p_show_audio": False,
+    "p_max_iterations": melody.DEFAULT_LIMITS.iterations,
+    "p_max_notes": melody.DEFAULT_LIMITS.notes,
+    "p_max_seconds": melody.DEFAULT_LIMITS.seconds,
     "p_initial_x": "",
     "p_new_x": "",
     "p_pitch": "",
@@ -80,38 +88,14 @@ def add_expression():
 def remove_expression():
     st.session_state["p_expression_count"] -= 1
 
-def quantize_duration(duration: float) -> float:
-    return 2 ** round(math.log2(duration))
-
-def get_pitchclassset_from_scale(scale: str) -> set[int]:
-    root_str, decimal_str = scale.split("-", 1)
-
-    root = PITCHNAMES.index(root_str)
-
-    if root == -1:
-        raise Exception("Invalid scale")
-
-    try:
-        decimal = int(decimal_str)
-    except:
-        raise Exception("Invalid scale")
-
-    binary = bin(decimal)[2:].zfill(12)
-
-    if len(binary) > 12:
-        raise Exception("Invalid scale")
-
-    pitches = []
+def add_voice():
+    n = st.session_state["p_voice_count"]
+    for field in melody.FIELDS:
+        st.session_state["p_voice_{}_{}".format(n, field)] = st.session_state["p_" + field]
+    st.session_state["p_voice_count"] += 1
 
-    for x in range(12):
-        if binary[11 - x] == "1":
-            pitches.append(x + root - 3)
-
-    return pitches
-
-def degree_to_pitch(degree: int, pitchclassset: set[int]) -> int:
-            octave = math.floor(degree / len(pitchclassset)) + 4
-            return pitchclassset[degree % len(pitchclassset)] + 12 * octave
+def remove_voice():
+    st.session_state["p_voice_count"] -= 1
 
 def compile_settings() -> str:
     settings = {
@@ -133,6 +117,11 @@ def compile_settings() -> str:
         "rest": st.session_state["p_rest"],
         "velocity": st.session_state["p_velocity"],
     }
+    if st.session_state["p_voice_count"] > 1:
+        settings["voices"] = [
+            {field: st.session_state["p_voice_{}_{}".format(n, field)] for field in melody.FIELDS}
+            for n in range(1, st.session_state["p_voice_count"])
+        ]
     return json.dumps(settings)
 
 def load_settings(settings: dict):
@@ -150,10 +139,15 @@ def load_settings(settings: dict):
     st.session_state["p_expression_count"] = len(settings["expressions"])
     for i, expression in enumerate(settings["expressions"]):
         st.session_state["p_expression_{}".format(i)] = expression
+    voices = settings.get("voices", [])
+    st.session_state["p_voice_count"] = 1 + len(voices)
+    for n, voice in enumerate(voices, 1):
+        for field in melody.FIELDS:
+            st.session_state["p_voice_{}_{}".format(n, field)] = voice[field]
 
 def load_settings_from_file(path_to_file: str):
-    midi = mido.MidiFile(path_to_file)
-    settings = json.loads(midi.tracks[1][0].text)
+    with timing.start(st.session_state, "melody_creator").stage("file reads"):
+        settings = melody.load_settings_from_file(path_to_file)
     load_settings(settings)
 
 def load_demo():
@@ -174,7 +168,11 @@ while True:
     del st.session_state["p_expression_" + str(x)]
     index += 1
 
-expression_bank.clear()
+# Each session has its own letters
+if "expression_bank" not in st.session_state:
+    st.session_state["expression_bank"] = expression_bank.ExpressionBank()
+bank = st.session_state["expression_bank"]
+bank.clear()
 
 # Layout
 
@@ -201,7 +199,7 @@ if st.session_state["p_scale"] == "":
     st.info("**Scale** is unspecified.")
 else:
     try:
-        get_pitchclassset_from_scale(st.session_state["p_scale"])
+        melody.get_pitchclassset_from_scale(st.session_state["p_scale"])
     except:
         st.error("Scale is invalid.")
 
@@ -224,35 +222,54 @@ if st.session_state["p_expression_count"] > 0:
 if st.session_state["p_expression_count"] > 0:
     st.checkbox("Show Plot", key="p_show_plot")
 
+timings.lap("layout")
+
 for x in range(st.session_state["p_expression_count"]):
     letter = chr(ord("A") + x)
-    expression_bank.store(letter, st.session_state["p_expression_" + str(x)])
+    bank.store(letter, st.session_state["p_expression_" + str(x)])
+
+for cycle in bank.cycles():
+    st.error("**{}** refer to each other in a cycle.".format(" → ".join(cycle)))
+
+timings.lap("expressions")
 
 if st.session_state["p_show_plot"]:
+    # Plotly is only imported once a plot is shown
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    import lib.plot_sampling as plot_sampling
+
+    columns = st.columns(2)
+    with columns[0]:
+        st.number_input("From", key="p_plot_start", help="Smallest x-value in the plot.")
+    with columns[1]:
+        st.number_input("To", key="p_plot_stop", help="Largest x-value in the plot.")
+
+    start = st.session_state["p_plot_start"]
+    stop = st.session_state["p_plot_stop"]
+
     fig = make_subplots()
 
+    if stop <= start:
+        st.error("**To** must be greater than **From**.")
+
     for x in range(st.session_state["p_expression_count"]):
         expression = st.session_state["p_expression_" + str(x)]
-        if expression != "":
+        if expression != "" and stop > start:
             letter = chr(ord("A") + x)
-            x = np.linspace(0, 10, 500)
-            y = []
-            for x_value in x:
-                try:
-                    y.append(expression_bank.evaluate(expression, x_value))
-                except:
-                    st.error(
-                        "**{}** failed to evaluate at x={}".format(letter, x_value)
-                    )
-                    break
-            trace = go.Scatter(x=x, y=y)
-            if trace != None:
-                trace.name = letter
-                fig.add_trace(trace)
-            else:
+            try:
+                x, y = plot_sampling.sample_expression(
+                    lambda x_values: bank.evaluate_array(expression, x_values), start, stop
+                )
+            except:
                 st.error("**{}** failed to evaluate.".format(letter))
+                continue
+            fig.add_trace(go.Scattergl(x=x, y=y, mode="lines", name=letter))
+
+    st.plotly_chart(fig, use_container_width=True)
 
-    st.plotly_chart(fig)
+    timings.lap("plot")
 
 st.header("Generation")
 
@@ -288,89 +305,79 @@ if st.session_state["p_velocity"] == "":
     st.info("**Velocity** is unspecified.")
     is_ready = False
 
-# Generation
+for n in range(1, st.session_state["p_voice_count"]):
+    with st.expander("Voice {}".format(n + 1), expanded=True):
+        for field, label in melody.FIELDS.items():
+            st.text_input(label, key="p_voice_{}_{}".format(n, field))
+            if st.session_state["p_voice_{}_{}".format(n, field)] == "":
+                st.info("{} is unspecified.".format(melody.field_label(field, n)))
+                is_ready = False
 
-if is_ready:
-    try:
-        mf = MIDIFile(1)
-        mf.addText(0, 0, compile_settings())
-        mf.addTempo(0, 0, st.session_state["p_tempo"])
-        mf.addTimeSignature(
-            0,
-            0,
-            st.session_state["p_time_numerator"],
-            int(math.log2(st.session_state["p_time_denominator"])),
-            24,
-        )
-        
-        pitchclassset = get_pitchclassset_from_scale(st.session_state["p_scale"])
+columns = st.columns(2)
 
-        try:
-            x = expression_bank.evaluate(st.session_state["p_initial_x"])
-        except:
-            raise Exception("**Initial X** failed to evaluate.")
-        
-        time = 0
+with columns[0]:
+    st.button("Add Voice", on_click=add_voice, help="Adds a voice on its own track, starting as a copy of the first.")
 
-        while time < st.session_state["p_length"]:
-            try:
-                p_new_x = float(expression_bank.evaluate(st.session_state["p_new_x"], x))
-            except:
-                raise Exception("**New X** failed to evaluate at x = {}".format(x))
-            try:
-                pitch = int(expression_bank.evaluate(st.session_state["p_pitch"], x))
-            except:
-                raise Exception("**Pitch** failed to evaluate at x = {}".format(x))
-            try:
-                duration = float(expression_bank.evaluate(st.session_state["p_duration"], x))
-            except:
-                raise Exception("**Duration** failed to evaluate at x = {}".format(x))
-            try:
-                is_rest = bool(expression_bank.evaluate(st.session_state["p_rest"], x))
-            except:
-                raise Exception("**Rest** failed to evaluate at x = {}".format(x))
-            try:
-                velocity = int(expression_bank.evaluate(st.session_state["p_velocity"], x))
-            except:
-                raise Exception("**Velocity** failed to evaluate at x = {}".format(x))
+if st.session_state["p_voice_count"] > 1:
+    with columns[1]:
+        st.button("Remove Voice", on_click=remove_voice)
+
+with st.expander("Limits"):
+    st.number_input("Max Iterations", 1, None, step=1000, key="p_max_iterations", help="Stops generation after this many x-values.")
+    st.number_input("Max Notes", 1, None, step=1000, key="p_max_notes")
+    st.number_input("Max Seconds", 0.1, None, step=1.0, key="p_max_seconds", help="Stops generation after this much time.")
 
-            duration = max(0, duration)
+timings.lap("layout")
 
-            if duration > 0:
-                duration = quantize_duration(duration)
-                if not is_rest:
-                    pitch = min(128, max(0, degree_to_pitch(pitch, pitchclassset)))
-                    velocity = max(0, min(127, velocity))
-                    mf.addNote(0, 0, pitch, time, duration, velocity)
+# Generation
+
+mf = None
+
+if is_ready:
+    progress_bar = st.empty()
 
-            x = p_new_x
-            time += duration
+    def show_progress(report: melody.GenerationReport, fraction: float):
+        if report.elapsed > 0.5:
+            progress_bar.progress(fraction, text="Generating... ({} notes)".format(report.notes))
 
+    limits = melody.Limits(
+        st.session_state["p_max_iterations"],
+        st.session_state["p_max_notes"],
+        st.session_state["p_max_seconds"],
+    )
+
+    try:
+        mf, report = melody.generate_cached(json.loads(compile_settings()), limits, show_progress)
     except Exception as e:
         st.exception(e)
     else:
-        st.success("Generation succeeded!", icon="🎉")
+        if report.is_partial:
+            st.warning(report.describe() + " The melody is incomplete.", icon="⏱️")
+        else:
+            st.success("Generation succeeded!", icon="🎉")
+    finally:
+        progress_bar.empty()
+
+    timings.lap("generation")
 
 # Playback
 
 def play():
     try:
-        with open("melody.mid", "wb") as f:
-            mf.writeFile(f)
+        with timing.start(st.session_state, "melody_creator").stage("serialization"):
+            data = playback.midi_to_bytes(mf)
     except:
         st.toast("Failed to write output to MIDI.", icon='😢')
     else:
-        pygame.mixer.init()
-        pygame.mixer.music.load("melody.mid")
-        pygame.mixer.music.play()
-        os.remove("melody.mid")
+        playback.play_bytes(data)
 
 def stop():
-    pygame.mixer.music.stop()
+    playback.stop()
 
 # Save and load
 
 def save():
+    from filedialogs import save_file_dialog
     wd = os.getcwd()
     savepath = save_file_dialog(
         "Save File", 
@@ -379,14 +386,15 @@ def save():
     )
     if savepath:
         try:
-            with open(savepath, "wb") as f:
-                mf.writeFile(f)
+            with timing.start(st.session_state, "melody_creator").stage("serialization"):
+                playback.save_midi(mf, savepath)
         except:
             st.toast("Failed to write output to MIDI.", icon='😢')
         st.session_state["p_default_savepath"] = savepath
     os.chdir(wd)
 
 def load():
+    from filedialogs import open_file_dialog
     wd = os.getcwd()
     openpath = open_file_dialog(
         "Load File",
@@ -418,6 +426,23 @@ with columns[2]:
 with columns[3]:
     st.button("Load", on_click=load)
 
+st.checkbox(
+    "Audio Preview",
+    key="p_show_audio",
+    disabled=mf is None,
+    help="Renders the melody with the built-in synthesizer and plays it in the browser.",
+)
+
+# Longer melodies are cut short, since the whole preview is held in memory
+AUDIO_PREVIEW_SECONDS = 300
+
+if st.session_state["p_show_audio"] and mf is not None:
+    import lib.synth as synth
+    with timings.stage("audio"):
+        data = synth.render_midi(mf, seconds=AUDIO_PREVIEW_SECONDS)
+    st.audio(data, format="audio/wav")
+    if report.time * 60 / st.session_state["p_tempo"] > AUDIO_PREVIEW_SECONDS:
+        st.caption("The preview only plays the first {} seconds of the melody.".format(AUDIO_PREVIEW_SECONDS))
 
 # Configure sidebar
 
@@ -430,4 +455,13 @@ with st.sidebar:
     columns[0].button(
         "Load Demo", 
         on_click=lambda: load_demo()
-    )
\ No newline at end of file
+    )
+
+    cache_info = melody.cache_info()
+    st.caption(
+        "Generation cache: {} hits, {} misses ({}/{} melodies)".format(
+            cache_info.hits, cache_info.misses, cache_info.currsize, cache_info.maxsize
+        )
+    )
+
+show_timings(timings.finish())
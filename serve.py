@@ -0,0 +1,60 @@
+"""
+MusicTools - Music Generation Software
+Copyright (C) 2023  David Rud Pedersen
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+# Serve melody generation and scale lookups over HTTP on this machine.
+#
+#   python serve.py --port 8765
+#   curl -X POST --data-binary @settings.json localhost:8765/generate -o melody.mid
+#   curl "localhost:8765/names/2741"
+#
+# See lib/service.py for the endpoints.
+
+import argparse
+import sys
+
+from lib import service
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve Melody Creator generation and Scale Explorer lookups over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--threads", type=int, default=service.DEFAULT_THREADS, help="requests handled at once")
+    parser.add_argument("--queue", type=int, default=service.DEFAULT_QUEUE, help="requests waiting before new ones get 503")
+    parser.add_argument("--workers", type=int, default=None, help="generation worker processes")
+    parser.add_argument("--timeout", type=float, default=service.DEFAULT_TIMEOUT, help="seconds per request")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    server = service.Service(
+        (args.host, args.port),
+        threads=args.threads,
+        workers=args.workers,
+        queue=args.queue,
+        request_timeout=args.timeout,
+        verbose=args.verbose,
+    )
+    print("Serving on http://{}:{}".format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())